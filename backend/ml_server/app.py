@@ -1,11 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+import hmac
+import multiprocessing as mp
 import os
-from models.prescription_analyzer import PrescriptionAnalyzer
-from werkzeug.utils import secure_filename
+import threading
+import time
 import logging
-from models.disease_predictor import DiseasePredictor
+from models.lazy_component import LazyComponent, ComponentUnavailable
+from models.training_jobs import TrainingJobManager
+from models import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,23 +21,207 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Initialize prescription analyzer
-prescription_analyzer = PrescriptionAnalyzer()
+def load_prescription_analyzer():
+    # Imported here so torch and EasyOCR are only loaded with the component
+    from models.prescription_analyzer import PrescriptionAnalyzer
+    return PrescriptionAnalyzer()
 
-# Initialize disease predictor
-disease_predictor = DiseasePredictor()
+def load_disease_predictor():
+    from models.disease_predictor import DiseasePredictor
+    return DiseasePredictor()
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
+# Heavy components load in the background; routes wait up to COMPONENT_WAIT seconds for them
+prescription_analyzer = LazyComponent('prescription_analyzer', load_prescription_analyzer)
+disease_predictor = LazyComponent('disease_predictor', load_disease_predictor)
+COMPONENTS = {component.name: component for component in (disease_predictor, prescription_analyzer)}
+COMPONENT_WAIT = float(os.getenv('ML_COMPONENT_WAIT', 30))
+
+# Called after this process swaps a model, so other serving processes can
+# follow; serve.py registers one that signals its workers to reload_models()
+_model_change_hooks = []
+
+def register_model_change_hook(hook):
+    _model_change_hooks.append(hook)
+
+def models_changed():
+    for hook in _model_change_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"Error announcing a model change: {str(e)}")
+
+def reload_models():
+    """Serve the models another process activated or trained, if they changed"""
+    # Components that are not built yet load the current models when they are
+    if disease_predictor.ready:
+        disease_predictor.get().sync_with_registry()
+    if prescription_analyzer.ready:
+        prescription_analyzer.get().reload_crnn_model(if_changed=True)
+
+def reload_crnn_model():
+    # Nothing to reload if the analyzer has not been built yet; it will load the new weights
+    if prescription_analyzer.ready:
+        prescription_analyzer.get().reload_crnn_model()
+    models_changed()
+
+# CRNN training runs in a separate process; the analyzer reloads the weights when it finishes.
+# Job state lives in a directory so every serving worker sees the same jobs
+training_jobs = TrainingJobManager(
+    on_complete=reload_crnn_model,
+    state_dir=os.getenv('ML_TRAINING_STATE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'models', 'training_jobs'
+    )
+)
+
+def warm_up_components():
+    # One at a time, cheapest first, so disease prediction is not slowed by torch/EasyOCR imports
+    for component in COMPONENTS.values():
+        try:
+            component.get()
+        except ComponentUnavailable:
+            pass
+
+# Spawned training processes re-import this module, directly or through
+# async_app, and must not load models. Spawn names the child before it
+# imports anything (parent_process() is only set later), so check the name
+if mp.current_process().name == 'MainProcess' and os.getenv('ML_WARMUP_ON_START', '1') != '0':
+    threading.Thread(target=warm_up_components, name='warmup', daemon=True).start()
+
+# Configure uploads; files are processed in memory and never written to disk
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+MAX_BATCH_SIZE = int(os.getenv('MAX_PREDICTION_BATCH_SIZE', 1000))
+ADMIN_TOKEN = os.getenv('ML_ADMIN_TOKEN')
+
+# Per-request stage timings are returned in a Server-Timing header when the
+# request sends X-Debug-Timing: 1, or for every request with ML_DEBUG_TIMING=1
+DEBUG_TIMING = os.getenv('ML_DEBUG_TIMING', '0') == '1'
+
+def timing_requested(headers):
+    return DEBUG_TIMING or headers.get('X-Debug-Timing') == '1'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.trace_token = metrics.start_trace() if timing_requested(request.headers) else None
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_duration.observe(time.perf_counter() - g.request_start, route=route)
+    metrics.requests_total.inc(route=route, status=response.status_code)
+    if g.get('trace_token') is not None:
+        trace = metrics.end_trace(g.trace_token)
+        g.trace_token = None
+        response.headers['Server-Timing'] = metrics.server_timing(trace)
+    return response
+
+def collect_component_metrics():
+    """Expose stats kept by the components, without forcing them to load"""
+    lines = ['# TYPE ml_component_ready gauge']
+    lines.extend(f'ml_component_ready{{component="{name}"}} {int(component.ready)}' for name, component in COMPONENTS.items())
+
+    if disease_predictor.ready:
+        cache = disease_predictor.get().cache.stats()
+        lines.append('# TYPE ml_prediction_cache_events_total counter')
+        lines.extend(f'ml_prediction_cache_events_total{{event="{event}"}} {cache[event]}' for event in ('hits', 'misses', 'evictions'))
+        lines.extend(['# TYPE ml_prediction_cache_size gauge', f"ml_prediction_cache_size {cache['size']}"])
+
+    if prescription_analyzer.ready:
+        analyzer = prescription_analyzer.get()
+        lines.append('# TYPE ml_ocr_answers_total counter')
+        for mode, stages in analyzer.ocr_stage_stats().items():
+            lines.extend(f'ml_ocr_answers_total{{mode="{mode}",stage="{stage}"}} {count}' for stage, count in stages.items())
+        lines.append('# TYPE ml_ocr_dropped_jobs_total counter')
+        for job, reasons in analyzer.ocr_dropped_job_stats().items():
+            lines.extend(f'ml_ocr_dropped_jobs_total{{job="{job}",reason="{reason}"}} {count}' for reason, count in reasons.items())
+        batching = analyzer.crnn_batching_stats()
+        if batching is not None:
+            lines.extend([
+                '# TYPE ml_crnn_queue_depth gauge', f"ml_crnn_queue_depth {batching['queue_depth']}",
+                '# TYPE ml_crnn_batches_total counter', f"ml_crnn_batches_total {batching['batches']}",
+                '# TYPE ml_crnn_batched_items_total counter', f"ml_crnn_batched_items_total {batching['items']}"
+            ])
+    return lines
+
+metrics.register_collector(collect_component_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(ComponentUnavailable)
+def component_unavailable(e):
+    response = jsonify({'success': False, 'error': str(e), 'component': e.component})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+@app.route('/api/ml/health/live', methods=['GET'])
+def liveness():
+    return jsonify({'success': True, 'status': 'alive'})
+
+@app.route('/api/ml/health/ready', methods=['GET'])
+def readiness():
+    """200 once every component has loaded; ?component=<name> checks just one"""
+    name = request.args.get('component')
+    if name is not None and name not in COMPONENTS:
+        return jsonify({'success': False, 'error': f"Unknown component: {name}"}), 404
+    checked = [COMPONENTS[name]] if name else list(COMPONENTS.values())
+    ready = all(component.ready for component in checked)
+    return jsonify({
+        'success': ready,
+        'ready': ready,
+        'components': {component.name: component.status() for component in checked}
+    }), 200 if ready else 503
+
+@app.route('/api/ml/warmup', methods=['POST'])
+def warmup():
+    """Start loading components; with {"wait": true} respond once they are loaded"""
+    data = request.get_json(silent=True) or {}
+    names = data.get('components') or list(COMPONENTS)
+    unknown = [name for name in names if name not in COMPONENTS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown components: {', '.join(unknown)}"}), 404
+
+    for name in names:
+        COMPONENTS[name].start()
+    if data.get('wait'):
+        for name in names:
+            try:
+                COMPONENTS[name].get()
+            except ComponentUnavailable:
+                pass
+
+    return jsonify({
+        'success': all(COMPONENTS[name].ready for name in names) or not data.get('wait'),
+        'components': {name: COMPONENTS[name].status() for name in names}
+    })
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def admin_denied():
+    """The error response for an admin request without a valid X-Admin-Token, or None.
+
+    Admin routes are disabled unless ML_ADMIN_TOKEN is set.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Admin routes are disabled; set ML_ADMIN_TOKEN'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return None
+
+def parse_top_k(data):
+    """Read the optional top_k differential size from a request body"""
+    top_k = data.get('top_k', 1)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise ValueError('top_k must be a positive integer')
+    return top_k
+
 @app.route('/api/ml/analyze-prescription', methods=['POST'])
 def analyze_prescription():
+    analyzer = prescription_analyzer.get(timeout=COMPONENT_WAIT)
     try:
         logger.info("Received prescription analysis request")
         
@@ -50,19 +238,22 @@ def analyze_prescription():
             logger.error(f"Invalid file type: {file.filename}")
             return jsonify({'success': False, 'error': 'Invalid file type'}), 400
             
-        # Create upload directory if it doesn't exist
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        # Save and process file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Decode the upload once; every OCR stage shares the decoded image
+        try:
+            image = analyzer.load_image(file.read())
+        except ValueError as e:
+            logger.error(f"Invalid image upload {file.filename}: {str(e)}")
+            return jsonify({'success': False, 'error': 'Invalid image file'}), 400
         
-        logger.info(f"File saved to {filepath}")
+        logger.info(f"Decoded {file.filename} ({image.shape[1]}x{image.shape[0]})")
         
         # Extract text from prescription
-        extracted_text = prescription_analyzer.extract_text(filepath)
-        logger.info(f"Extracted text: {extracted_text}")
+        try:
+            extraction = analyzer.extract_text_details(image, mode=request.form.get('ocr_mode'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        extracted_text = extraction['text']
+        logger.info(f"Extracted text ({extraction['mode']}/{extraction['stage']}): {extracted_text}")
         
         if not extracted_text:
             logger.error("No text extracted from image")
@@ -72,17 +263,17 @@ def analyze_prescription():
             }), 400
         
         # Analyze prescription
-        analysis_result = prescription_analyzer.analyze_prescription(extracted_text)
+        analysis_result = analyzer.analyze_prescription(extracted_text)
+        interactions = analyzer.check_interactions(analysis_result['medications'])
         logger.info(f"Analysis result: {analysis_result}")
         
-        # Clean up uploaded file
-        os.remove(filepath)
-        
         return jsonify({
             'success': True,
             'result': {
                 'extracted_text': extracted_text,
-                'analysis': analysis_result
+                'ocr_stage': extraction['stage'],
+                'analysis': analysis_result,
+                'interactions': interactions
             }
         })
         
@@ -90,25 +281,67 @@ def analyze_prescription():
         logger.error(f"Error processing prescription: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ml/analyze-prescription/stats', methods=['GET'])
+def ocr_stage_stats():
+    analyzer = prescription_analyzer.get(timeout=COMPONENT_WAIT)
+    return jsonify({
+        'success': True,
+        'mode': analyzer.ocr_mode,
+        'stages': analyzer.ocr_stage_stats(),
+        'dropped_jobs': analyzer.ocr_dropped_job_stats(),
+        'crnn_batching': analyzer.crnn_batching_stats(),
+        'drug_knowledge': analyzer.drug_knowledge.stats()
+    })
+
 @app.route('/api/ml/train', methods=['POST'])
 def train_model():
     try:
-        from models.train_crnn import train_crnn
-        train_crnn()
-        return jsonify({'success': True, 'message': 'Model training completed'})
+        job_id = training_jobs.submit()
+        if job_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'A training job is already running',
+                'job_id': training_jobs.active_job()
+            }), 409
+        return jsonify({'success': True, 'job_id': job_id}), 202
     except Exception as e:
-        logger.error(f"Error training model: {str(e)}", exc_info=True)
+        logger.error(f"Error starting training job: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ml/train/jobs', methods=['GET'])
+def list_training_jobs():
+    return jsonify({'success': True, 'jobs': training_jobs.list_jobs()})
+
+@app.route('/api/ml/train/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    try:
+        return jsonify({'success': True, 'job': training_jobs.get(job_id)})
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+
+@app.route('/api/ml/train/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    try:
+        cancelled = training_jobs.cancel(job_id)
+        return jsonify({'success': True, 'cancelled': cancelled, 'job': training_jobs.get(job_id)})
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+
 @app.route('/api/ml/predict-disease', methods=['POST'])
 def predict_disease():
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
     try:
         data = request.get_json()
         if not data or 'symptoms' not in data:
             return jsonify({'success': False, 'error': 'No symptoms provided'}), 400
 
+        try:
+            top_k = parse_top_k(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
         symptoms = data['symptoms']
-        prediction = disease_predictor.predict_disease(symptoms)
+        prediction = predictor.predict_disease(symptoms, top_k=top_k)
         
         return jsonify({
             'success': True,
@@ -119,7 +352,100 @@ def predict_disease():
         logger.error(f"Error predicting disease: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ml/predict-disease/batch', methods=['POST'])
+def predict_disease_batch():
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
+    try:
+        data = request.get_json()
+        if not data or 'symptoms' not in data:
+            return jsonify({'success': False, 'error': 'No symptoms provided'}), 400
+
+        symptom_lists = data['symptoms']
+        if not isinstance(symptom_lists, list):
+            return jsonify({'success': False, 'error': 'Symptoms must be a list of symptom lists'}), 400
+        if len(symptom_lists) > MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'Batch size exceeds the limit of {MAX_BATCH_SIZE}'
+            }), 400
+
+        try:
+            top_k = parse_top_k(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        results = predictor.predict_diseases_batch(symptom_lists, top_k=top_k)
+
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+
+    except Exception as e:
+        logger.error(f"Error predicting diseases in batch: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ml/predict-disease/cache', methods=['GET'])
+def prediction_cache_stats():
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
+    return jsonify({
+        'success': True,
+        'cache': predictor.cache.stats()
+    })
+
+@app.route('/api/ml/admin/disease-models', methods=['GET'])
+def list_disease_models():
+    denied = admin_denied()
+    if denied:
+        return denied
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
+    predictor.registry.refresh()
+    return jsonify({
+        'success': True,
+        'serving': predictor.version,
+        'registry': predictor.registry.list_versions()
+    })
+
+@app.route('/api/ml/admin/disease-models/load', methods=['POST'])
+def load_disease_model():
+    """Register the current model file or activate a registered version"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('version'):
+            version = predictor.activate_version(data['version'])
+        else:
+            version = predictor.register_model(activate=True)
+        models_changed()
+        return jsonify({'success': True, 'version': version})
+
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+    except Exception as e:
+        logger.error(f"Error loading disease model: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ml/admin/disease-models/rollback', methods=['POST'])
+def rollback_disease_model():
+    denied = admin_denied()
+    if denied:
+        return denied
+    predictor = disease_predictor.get(timeout=COMPONENT_WAIT)
+    try:
+        version = predictor.rollback()
+        models_changed()
+        return jsonify({'success': True, 'version': version})
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error rolling back disease model: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Development server; serve.py is the multi-process production entry point
 if __name__ == '__main__':
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     port = int(os.getenv('PORT', 5002))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""Asyncio serving mode for the ML API.
+
+    PORT=5002 python async_app.py
+
+Serves the same routes as app.py from one event loop, so thousands of open
+connections cost no threads. Prescription analysis and disease prediction
+are handled natively: CPU-bound work goes to a bounded thread pool and
+Tesseract runs as async subprocesses. Every other route is passed through
+to the Flask app on a small thread pool. When a pool's queue is full the
+request is rejected with 429 and Retry-After instead of waiting.
+"""
+import asyncio
+import os
+import time
+import logging
+from aiohttp import web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+import app as ml_app
+from models.backpressure import AsyncLimiter, BoundedExecutor, QueueFull
+from models.lazy_component import ComponentUnavailable
+from models import metrics
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 2
+cpu_executor = BoundedExecutor(
+    'cpu', int(os.getenv('ASYNC_CPU_WORKERS', CPU_COUNT)), int(os.getenv('ASYNC_CPU_QUEUE', 64))
+)
+tesseract_limiter = AsyncLimiter(
+    'tesseract', int(os.getenv('ASYNC_TESSERACT_CONCURRENCY', CPU_COUNT)), int(os.getenv('ASYNC_TESSERACT_QUEUE', 256))
+)
+wsgi_executor = BoundedExecutor(
+    'wsgi', int(os.getenv('ASYNC_WSGI_WORKERS', 8)), int(os.getenv('ASYNC_WSGI_QUEUE', 64))
+)
+_async_ocr = None
+
+def error(message, status, **extra):
+    return web.json_response({'success': False, 'error': message, **extra}, status=status)
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Request metrics and Server-Timing for native routes; Flask records its own"""
+    if request.match_info.handler is flask_passthrough:
+        return await handler(request)
+    start = time.perf_counter()
+    token = metrics.start_trace() if ml_app.timing_requested(request.headers) else None
+    try:
+        response = await handler(request)
+    finally:
+        trace = metrics.end_trace(token) if token is not None else None
+    route = request.match_info.route.resource.canonical
+    metrics.request_duration.observe(time.perf_counter() - start, route=route)
+    metrics.requests_total.inc(route=route, status=response.status)
+    if trace is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(trace)
+    return response
+
+@web.middleware
+async def error_middleware(request, handler):
+    try:
+        return await handler(request)
+    except QueueFull as e:
+        response = error(f"Server is busy: {str(e)}", 429)
+        response.headers['Retry-After'] = '1'
+        return response
+    except ComponentUnavailable as e:
+        response = error(str(e), 503, component=e.component)
+        response.headers['Retry-After'] = '5'
+        return response
+
+async def get_component(component):
+    """Wait for a lazily loaded component without blocking the event loop"""
+    if component.ready:
+        return component.get()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, component.get, ml_app.COMPONENT_WAIT)
+
+async def get_async_ocr():
+    global _async_ocr
+    analyzer = await get_component(ml_app.prescription_analyzer)
+    if _async_ocr is None or _async_ocr.analyzer is not analyzer:
+        # Imported here so torch and EasyOCR are only loaded with the component
+        from models.async_ocr import AsyncPrescriptionOCR
+        _async_ocr = AsyncPrescriptionOCR(analyzer, cpu_executor, tesseract_limiter)
+    return _async_ocr
+
+async def analyze_prescription(request):
+    ocr = await get_async_ocr()
+    analyzer = ocr.analyzer
+    try:
+        form = await request.post()
+        file = form.get('prescription')
+        if file is None or not hasattr(file, 'file'):
+            return error('No file uploaded', 400)
+        if file.filename == '':
+            return error('No file selected', 400)
+        if not ml_app.allowed_file(file.filename):
+            return error('Invalid file type', 400)
+
+        # Decode the upload once; every OCR stage shares the decoded image
+        try:
+            image = await cpu_executor.run(analyzer.load_image, file.file.read())
+        except ValueError as e:
+            logger.error(f"Invalid image upload {file.filename}: {str(e)}")
+            return error('Invalid image file', 400)
+
+        try:
+            extraction = await ocr.extract_text_details(image, mode=form.get('ocr_mode'))
+        except ValueError as e:
+            return error(str(e), 400)
+        extracted_text = extraction['text']
+        if not extracted_text:
+            return error('Could not extract text from image', 400)
+
+        # Lexicon matching and entity extraction are CPU-bound; keep them off the event loop
+        analysis_result = await cpu_executor.run(analyzer.analyze_prescription, extracted_text)
+        interactions = await cpu_executor.run(analyzer.check_interactions, analysis_result['medications'])
+        return web.json_response({
+            'success': True,
+            'result': {
+                'extracted_text': extracted_text,
+                'ocr_stage': extraction['stage'],
+                'analysis': analysis_result,
+                'interactions': interactions
+            }
+        })
+
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing prescription: {str(e)}", exc_info=True)
+        return error(str(e), 500)
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+async def predict_disease(request):
+    predictor = await get_component(ml_app.disease_predictor)
+    try:
+        data = await read_json(request)
+        if not data or 'symptoms' not in data:
+            return error('No symptoms provided', 400)
+        try:
+            top_k = ml_app.parse_top_k(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        prediction = await cpu_executor.run(predictor.predict_disease, data['symptoms'], top_k)
+        return web.json_response({'success': True, 'prediction': prediction})
+
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error predicting disease: {str(e)}", exc_info=True)
+        return error(str(e), 500)
+
+async def predict_disease_batch(request):
+    predictor = await get_component(ml_app.disease_predictor)
+    try:
+        data = await read_json(request)
+        if not data or 'symptoms' not in data:
+            return error('No symptoms provided', 400)
+        symptom_lists = data['symptoms']
+        if not isinstance(symptom_lists, list):
+            return error('Symptoms must be a list of symptom lists', 400)
+        if len(symptom_lists) > ml_app.MAX_BATCH_SIZE:
+            return error(f'Batch size exceeds the limit of {ml_app.MAX_BATCH_SIZE}', 400)
+        try:
+            top_k = ml_app.parse_top_k(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        results = await cpu_executor.run(predictor.predict_diseases_batch, symptom_lists, top_k)
+        return web.json_response({'success': True, 'results': results})
+
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error predicting diseases in batch: {str(e)}", exc_info=True)
+        return error(str(e), 500)
+
+async def executor_stats(request):
+    return web.json_response({
+        'success': True,
+        'executors': {
+            'cpu': cpu_executor.stats(),
+            'tesseract': tesseract_limiter.stats(),
+            'wsgi': wsgi_executor.stats()
+        }
+    })
+
+def call_flask(environ):
+    app_iter, status, headers = run_wsgi_app(ml_app.app, environ, buffered=True)
+    try:
+        body = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    return int(status.split(' ', 1)[0]), headers, body
+
+async def flask_passthrough(request):
+    """Serve any other route with the Flask app on the wsgi pool"""
+    environ = EnvironBuilder(
+        path=request.path,
+        method=request.method,
+        headers=list(request.headers.items()),
+        query_string=request.query_string,
+        data=await request.read()
+    ).get_environ()
+    status, headers, body = await wsgi_executor.run(call_flask, environ)
+    headers = {key: value for key, value in headers.items() if key.lower() not in ('content-length', 'transfer-encoding')}
+    return web.Response(status=status, headers=headers, body=body)
+
+async def add_cors_headers(request, response):
+    # Passed-through routes already carry flask-cors headers; match them on native routes
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+
+def create_app():
+    application = web.Application(
+        middlewares=[metrics_middleware, error_middleware],
+        client_max_size=ml_app.app.config['MAX_CONTENT_LENGTH']
+    )
+    application.router.add_post('/api/ml/analyze-prescription', analyze_prescription)
+    application.router.add_post('/api/ml/predict-disease', predict_disease)
+    application.router.add_post('/api/ml/predict-disease/batch', predict_disease_batch)
+    application.router.add_get('/api/ml/async/executors', executor_stats)
+    application.router.add_route('*', '/{tail:.*}', flask_passthrough)
+    application.on_response_prepare.append(add_cors_headers)
+    return application
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', 5002)))
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+import logging
+import torch
+from models.prescription_analyzer import CRNN, char_list
+from models.micro_batcher import MicroBatcher
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_clients(infer, inputs, clients):
+    """Send every input from `clients` concurrent threads; returns requests per second"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(infer, inputs))
+    return len(inputs) / (time.perf_counter() - start)
+
+def main(requests=256):
+    torch.manual_seed(0)
+    model = CRNN(num_chars=len(char_list)).eval()
+    inputs = [torch.randn(1, 32, 128) for _ in range(requests)]
+
+    def single(image):
+        with torch.inference_mode():
+            return model(image.unsqueeze(0)).log_softmax(2).argmax(2)[0]
+
+    batched_fn = lambda images: list(model(images).log_softmax(2).argmax(2))
+
+    # Batching must not change the output of any single request
+    batcher = MicroBatcher(batched_fn, max_batch_size=16, max_wait_ms=5)
+    for image in inputs[:16]:
+        assert torch.equal(single(image), batcher.submit(image).result())
+
+    for clients in (1, 8, 32):
+        unbatched = run_clients(single, inputs, clients)
+        batcher = MicroBatcher(batched_fn, max_batch_size=16, max_wait_ms=5)
+        batched = run_clients(lambda image: batcher.submit(image).result(), inputs, clients)
+        stats = batcher.stats()
+        logger.info(
+            f"{clients:>2} clients: unbatched {unbatched:7.1f} req/s, batched {batched:7.1f} req/s "
+            f"(mean batch {stats['mean_batch_size']:.1f}, max queue depth {stats['max_queue_depth']})"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import io
+import os
+import time
+import logging
+import torch
+from models.prescription_analyzer import CRNN, char_list
+from models.export_crnn import WEIGHTS_PATH, build_inference_model, load_eager_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def serialized_mb(model):
+    """Size of the saved model, a proxy for the weights it keeps in memory"""
+    buffer = io.BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buffer)
+    else:
+        torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / 2**20
+
+def time_call(model, images, repeats):
+    with torch.inference_mode():
+        model(images)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(images)
+    return (time.perf_counter() - start) / repeats * 1e3
+
+def main(repeats=50):
+    torch.manual_seed(0)
+    if os.path.exists(WEIGHTS_PATH):
+        eager = load_eager_model()
+    else:
+        logger.warning(f"No trained weights at {WEIGHTS_PATH}, benchmarking random weights")
+        eager = CRNN(num_chars=len(char_list)).eval()
+
+    models = {
+        'eager fp32': eager,
+        'torchscript fp32': build_inference_model(eager, fold_bn=True, int8=False),
+        'torchscript int8': build_inference_model(eager, fold_bn=True, int8=True)
+    }
+
+    reference = None
+    images = torch.randn(16, 1, 32, 128)
+    for name, model in models.items():
+        with torch.inference_mode():
+            output = model(images).log_softmax(2)
+        if reference is None:
+            reference = output
+        drift = (output - reference).abs().max().item()
+        agreement = (output.argmax(2) == reference.argmax(2)).float().mean().item()
+        logger.info(f"{name:<17} {serialized_mb(model):6.1f} MB, max log-prob drift {drift:.4f}, argmax agreement {agreement:.1%}")
+        for batch in (1, 16):
+            logger.info(f"{'':<17} batch {batch:>2}: {time_call(model, images[:batch], repeats):7.2f} ms")
+
+if __name__ == "__main__":
+    main()
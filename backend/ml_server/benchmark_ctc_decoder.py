@@ -0,0 +1,54 @@
+import time
+import logging
+import torch
+from models.ctc_decoder import CTCDecoder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same alphabet as the CRNN; its output is [batch, 32 steps, len(CHAR_LIST)]
+CHAR_LIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?()-/: '
+TIME_STEPS = 32
+
+def legacy_beam_search(output, char_list, beam_size=5):
+    """The per-beam Python loop previously used in _extract_text_crnn"""
+    results = []
+    for b in range(output.size(0)):
+        sequences = [([], 0.0)]
+        for t in range(output.size(1)):
+            candidates = []
+            for seq, score in sequences:
+                probs = output[b, t].exp()
+                top_probs, top_indices = probs.topk(beam_size)
+                for prob, idx in zip(top_probs, top_indices):
+                    if idx < len(char_list):
+                        new_seq = seq + [char_list[idx]]
+                        new_score = score - torch.log(prob)
+                        candidates.append((new_seq, new_score))
+            sequences = sorted(candidates, key=lambda x: x[1])[:beam_size]
+        results.append(''.join(sequences[0][0]))
+    return results
+
+def time_call(fn, log_probs, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(log_probs)
+    return (time.perf_counter() - start) / repeats * 1e3
+
+def main(repeats=20):
+    torch.manual_seed(0)
+    greedy = CTCDecoder(CHAR_LIST, mode='greedy')
+    beam = CTCDecoder(CHAR_LIST, beam_size=5)
+
+    for batch in (1, 32):
+        log_probs = (torch.randn(batch, TIME_STEPS, len(CHAR_LIST)) * 4).log_softmax(2)
+        results = {
+            'legacy loop': time_call(lambda x: legacy_beam_search(x, CHAR_LIST), log_probs, repeats),
+            'greedy': time_call(greedy.decode, log_probs, repeats),
+            'prefix beam': time_call(beam.decode, log_probs, repeats),
+        }
+        for name, millis in results.items():
+            logger.info(f"batch {batch:>2} {name:<12} {millis:8.2f} ms/call")
+
+if __name__ == "__main__":
+    main()
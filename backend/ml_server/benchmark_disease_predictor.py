@@ -0,0 +1,130 @@
+import time
+import warnings
+import os
+import logging
+import numpy as np
+import pandas as pd
+from models.disease_predictor import DiseasePredictor
+from models.forest_engine import CompiledForest
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEST_CASES = [
+    ['itching', 'skin_rash', 'nodal_skin_eruptions'],
+    ['continuous_sneezing', 'chills', 'watering_from_eyes'],
+    ['stomach_pain', 'acidity', 'vomiting'],
+]
+
+def legacy_feature_vector(predictor, symptoms):
+    """Feature construction as done before the NumPy fast path"""
+    severity_dict = predictor.knowledge_base.severity
+    X = pd.DataFrame(0, index=[0], columns=predictor.symptoms_list)
+    for symptom in symptoms:
+        symptom = symptom.strip().lower()
+        if symptom in predictor.symptoms_list:
+            if symptom in severity_dict:
+                X.loc[0, symptom] = severity_dict[symptom]
+    return X
+
+def legacy_predict(predictor, symptoms):
+    X = legacy_feature_vector(predictor, symptoms)
+    prediction = predictor.model.predict(X)
+    probabilities = predictor.model.predict_proba(X)
+    return predictor.le.inverse_transform(prediction)[0], float(probabilities.max())
+
+def fast_predict(predictor, symptoms):
+    X = predictor._build_feature_vector(symptoms).reshape(1, -1)
+    probabilities = predictor.model.predict_proba(X)[0]
+    best = int(probabilities.argmax())
+    return predictor.le.classes_[predictor.model.classes_[best]], float(probabilities[best])
+
+def legacy_preprocess(predictor):
+    """Row-by-row feature matrix as built before vectorized preprocessing"""
+    df = pd.read_csv(os.path.join(predictor.base_path, 'data', 'dataset.csv'))
+    severity_dict = predictor.knowledge_base.severity
+    X = pd.DataFrame(0, index=range(len(df)), columns=predictor.symptoms_list)
+    for i, row in df.iterrows():
+        for col in df.columns:
+            if col.startswith('Symptom_'):
+                symptom = row[col]
+                if pd.notna(symptom):
+                    symptom = symptom.strip().lower()
+                    if symptom in severity_dict:
+                        X.loc[i, symptom] = severity_dict[symptom]
+    return X
+
+def check_preprocess_parity(predictor):
+    # preprocess_data rebinds the column order; keep the loaded model's order
+    symptoms_list = predictor.symptoms_list
+    start = time.perf_counter()
+    X, y = predictor.preprocess_data()
+    vectorized_time = time.perf_counter() - start
+    X_sparse, y_sparse = predictor.preprocess_data(sparse=True)
+
+    start = time.perf_counter()
+    expected = legacy_preprocess(predictor)
+    legacy_time = time.perf_counter() - start
+
+    assert list(X.columns) == list(expected.columns)
+    assert np.array_equal(X.to_numpy(), expected.to_numpy())
+    assert np.array_equal(X_sparse.toarray(), expected.to_numpy())
+    assert np.array_equal(y, y_sparse)
+    logger.info("Vectorized preprocessing matches the row-by-row matrix")
+    logger.info(f"preprocess (iterrows)   {legacy_time * 1e3:10.1f} ms")
+    logger.info(f"preprocess (vectorized) {vectorized_time * 1e3:10.1f} ms")
+    predictor.symptoms_list = symptoms_list
+
+def check_compiled_forest_parity(predictor, engine):
+    X, _ = predictor.preprocess_data()
+    X = X[predictor.symptoms_list].to_numpy(dtype=np.float32)
+    assert np.allclose(engine.predict_proba(X), predictor.model.predict_proba(X))
+    logger.info(f"Compiled forest matches sklearn probabilities on {len(X)} rows")
+
+    start = time.perf_counter()
+    predictor.model.predict_proba(X)
+    sklearn_time = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.predict_proba(X)
+    compiled_time = time.perf_counter() - start
+    logger.info(f"batch of {len(X)} (sklearn)  {sklearn_time * 1e3:10.1f} ms")
+    logger.info(f"batch of {len(X)} (compiled) {compiled_time * 1e3:10.1f} ms")
+
+def time_call(fn, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        fn(TEST_CASES[i % len(TEST_CASES)])
+    return (time.perf_counter() - start) / repeats * 1e6
+
+def main(repeats=200):
+    predictor = DiseasePredictor()
+    # The legacy path feeds a DataFrame to a model fitted on arrays
+    warnings.simplefilter('ignore', UserWarning)
+
+    for symptoms in TEST_CASES:
+        legacy = legacy_predict(predictor, symptoms)
+        fast = fast_predict(predictor, symptoms)
+        assert legacy[0] == fast[0] and np.isclose(legacy[1], fast[1]), (legacy, fast)
+        assert np.array_equal(
+            legacy_feature_vector(predictor, symptoms).to_numpy(dtype=np.float32)[0],
+            predictor._build_feature_vector(symptoms)
+        )
+    logger.info("Fast path matches the legacy path")
+    check_preprocess_parity(predictor)
+    engine = CompiledForest(predictor.model)
+    check_compiled_forest_parity(predictor, engine)
+
+    results = {
+        'features (pandas)': time_call(lambda s: legacy_feature_vector(predictor, s), repeats),
+        'features (numpy)': time_call(predictor._build_feature_vector, repeats),
+        'end-to-end (pandas)': time_call(lambda s: legacy_predict(predictor, s), repeats),
+        'end-to-end (numpy)': time_call(lambda s: fast_predict(predictor, s), repeats),
+        'end-to-end (compiled)': time_call(
+            lambda s: engine.predict_proba(predictor._build_feature_vector(s)), repeats
+        ),
+    }
+    for name, micros in results.items():
+        logger.info(f"{name:<22} {micros:10.1f} us/call")
+
+if __name__ == "__main__":
+    main()
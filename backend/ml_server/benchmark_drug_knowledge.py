@@ -0,0 +1,121 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import logging
+import requests
+from models.drug_knowledge import DrugKnowledgeBase, normalize_name
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def write_rxnconso(path, names):
+    """A minimal RXNCONSO.RRF: one ingredient atom and one synonym per concept"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, name in enumerate(names):
+            for tty, text in (('IN', name), ('SY', f"{name} tablet")):
+                fields = [''] * 18
+                fields[0], fields[11], fields[12], fields[14], fields[16] = str(100000 + i), 'RXNORM', tty, text, 'N'
+                f.write('|'.join(fields) + '\n')
+
+def write_interactions(path, num_concepts, num_pairs, rng):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('rxcui_a,rxcui_b,severity,description\n')
+        for _ in range(num_pairs):
+            a, b = rng.sample(range(num_concepts), 2)
+            f.write(f"{100000 + a},{100000 + b},{rng.choice(['high', 'moderate', 'low'])},Synthetic interaction\n")
+
+def mock_rxnav(names, latency):
+    """RxNav look-alike answering /drugs.json and /interaction/interaction.json after a fixed delay"""
+    rxcuis = {normalize_name(name): str(100000 + i) for i, name in enumerate(names)}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path.startswith('/drugs'):
+                name = params['name'][0]
+                rxcui = rxcuis.get(normalize_name(name))
+                groups = [{'conceptProperties': [{'rxcui': rxcui, 'name': name, 'synonym': '', 'tty': 'IN'}]}] if rxcui else []
+                body = {'drugGroup': {'conceptGroup': groups} if groups else {}}
+            else:
+                body = {'interactionTypeGroup': []}
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def legacy_prescription_lookup(base_url, names):
+    """One unpooled request per drug for details, then one per drug for interactions"""
+    rxcuis = []
+    for name in names:
+        data = requests.get(f"{base_url}/drugs.json", params={'name': name}).json()
+        rxcuis.append(data['drugGroup']['conceptGroup'][0]['conceptProperties'][0]['rxcui'])
+    for rxcui in rxcuis:
+        requests.get(f"{base_url}/interaction/interaction.json", params={'rxcui': rxcui}).json()
+
+def store_prescription_lookup(knowledge, names):
+    details = knowledge.find_drugs(names)
+    return knowledge.interactions_for([d['rxcui'] for d in details.values() if d])
+
+def timed(fn, *args, repeats=1):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats
+
+def main(num_concepts=100000, num_pairs=200000, latency=0.02):
+    rng = random.Random(0)
+    names = [f"drug{i:06d}" for i in range(num_concepts)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rxnconso, interactions = os.path.join(tmp, 'RXNCONSO.RRF'), os.path.join(tmp, 'interactions.csv')
+        write_rxnconso(rxnconso, names)
+        write_interactions(interactions, num_concepts, num_pairs, rng)
+
+        knowledge = DrugKnowledgeBase(os.path.join(tmp, 'rxnorm.sqlite3'))
+        start = time.perf_counter()
+        knowledge.load_rxnconso(rxnconso)
+        knowledge.load_interactions(interactions)
+        logger.info(f"Bulk-loaded {num_concepts} concepts and {num_pairs} pairs in {time.perf_counter() - start:.1f}s")
+
+        server = mock_rxnav(names, latency)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        prescription = rng.sample(names, 10)
+        legacy = timed(legacy_prescription_lookup, base_url, prescription, repeats=3)
+
+        cold = []
+        for _ in range(20):
+            knowledge.cache.clear()
+            cold.append(timed(store_prescription_lookup, knowledge, rng.sample(names, 10)))
+        warm = timed(store_prescription_lookup, knowledge, prescription, repeats=100)
+        logger.info(f"10-drug prescription: legacy HTTP ({latency * 1e3:.0f} ms per call) {legacy * 1e3:.0f} ms, "
+                    f"store cold {sum(cold) / len(cold) * 1e3:.2f} ms, LRU warm {warm * 1e3:.3f} ms")
+
+        # Names missing from the store go to the mock over the pooled session, once
+        online = DrugKnowledgeBase(os.path.join(tmp, 'empty.sqlite3'), base_url=base_url)
+        first = timed(online.find_drugs, prescription)
+        online.cache.clear()
+        second = timed(online.find_drugs, prescription)
+        logger.info(f"Fallback: first lookup {first * 1e3:.0f} ms over HTTP ({online.client.requests} requests), "
+                    f"after LRU eviction {second * 1e3:.2f} ms from the written-back store")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
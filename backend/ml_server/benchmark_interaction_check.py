@@ -0,0 +1,56 @@
+import os
+import random
+import tempfile
+import time
+import logging
+from models.drug_knowledge import DrugKnowledgeBase
+from models.interaction_index import InteractionIndex
+from benchmark_drug_knowledge import write_interactions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def per_drug_pairs(knowledge, rxcuis):
+    """The per-rxcui approach: one interaction lookup per drug, filtered to the prescription"""
+    prescribed = set(rxcuis)
+    pairs = set()
+    for rxcui in rxcuis:
+        knowledge.cache.clear()
+        for interaction in knowledge.interactions_for([rxcui])[rxcui]:
+            if interaction['rxcui'] in prescribed:
+                pairs.add(tuple(sorted((rxcui, interaction['rxcui']))))
+    return pairs
+
+def timed(fn, *args, repeats=1):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn(*args)
+    return result, (time.perf_counter() - start) / repeats
+
+def main(num_concepts=20000, num_pairs=400000, repeats=200):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'drug_interactions.csv')
+        write_interactions(path, num_concepts, num_pairs, rng)
+        knowledge = DrugKnowledgeBase(os.path.join(tmp, 'rxnorm.sqlite3'))
+        knowledge.load_interactions(path)
+
+        index = InteractionIndex(path)
+        _, build_time = timed(index.refresh)
+        logger.info(f"Indexed {len(index)} pairs among {num_concepts} rxcuis in {build_time:.1f}s")
+
+        for size in (5, 10, 20):
+            prescriptions = [[str(100000 + i) for i in rng.sample(range(num_concepts), size)] for _ in range(repeats)]
+            start = time.perf_counter()
+            expected = [per_drug_pairs(knowledge, rxcuis) for rxcuis in prescriptions]
+            per_drug = (time.perf_counter() - start) / repeats
+            start = time.perf_counter()
+            found = [index.pairs(rxcuis) for rxcuis in prescriptions]
+            indexed = (time.perf_counter() - start) / repeats
+            assert all(e == {(a, b) for a, b, _, _ in f} for e, f in zip(expected, found))
+            logger.info(f"{size:>2}-drug prescription: per-drug lookups {per_drug * 1e3:.2f} ms, "
+                        f"pairwise index {indexed * 1e3:.3f} ms, "
+                        f"{sum(map(len, found)) / repeats:.2f} interacting pairs on average")
+
+if __name__ == "__main__":
+    main()
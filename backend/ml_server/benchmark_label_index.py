@@ -0,0 +1,82 @@
+import os
+import random
+import tempfile
+import time
+import logging
+from models.label_index import LabelIndex
+from models.lexicon_index import edit_distance
+from benchmark_medication_lexicon import synthetic_names, misspell
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def legacy_find_closest_match(labels_file, predicted_text):
+    """PrescriptionAnalyzer._find_closest_match before the index"""
+    with open(labels_file, 'r') as f:
+        training_samples = [line.strip().split(',')[1] for line in f]
+
+    def similarity(a, b):
+        a = a.lower()
+        b = b.lower()
+        return sum(1 for x, y in zip(a, b) if x == y) / max(len(a), len(b))
+
+    matches = [(sample, similarity(predicted_text, sample)) for sample in training_samples]
+    best_match = max(matches, key=lambda x: x[1])
+    return best_match[0] if best_match[1] > 0.7 else None
+
+def write_labels(path, labels):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, label in enumerate(labels):
+            f.write(f"img_{i}.png,{label}\n")
+
+def main(num_labels=100000, num_queries=200):
+    rng = random.Random(0)
+    names = synthetic_names(rng, num_labels // 4)
+    labels = [
+        f"{rng.choice(names)} {rng.choice([250, 500, 650])}mg {rng.choice(['1-0-1', '0-0-1', '1-1-1'])}"
+        for _ in range(num_labels)
+    ]
+    queries = [misspell(rng, rng.choice(labels)) for _ in range(num_queries)]
+    keys = list(dict.fromkeys(' '.join(label.lower().split()) for label in labels))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'train_labels.txt')
+        write_labels(path, labels)
+
+        index = LabelIndex(path)
+        start = time.perf_counter()
+        size = len(index)
+        logger.info(f"Indexed {size} unique labels in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        results = [index.top_k(query, k=1, min_score=0.7) for query in queries]
+        indexed = (time.perf_counter() - start) / num_queries
+        start = time.perf_counter()
+        for query in queries:
+            index.top_k(query, k=5)
+        indexed_top5 = (time.perf_counter() - start) / num_queries
+
+        start = time.perf_counter()
+        for query in queries[:3]:
+            legacy_find_closest_match(path, query)
+        legacy = (time.perf_counter() - start) / 3
+        logger.info(f"Closest label lookup: index {indexed * 1e3:.3f} ms (top 5: {indexed_top5 * 1e3:.3f} ms), "
+                    f"legacy file scan {legacy * 1e3:.0f} ms")
+
+        # The top score must equal the best score of an exhaustive edit-distance scan
+        agree = 0
+        for query, result in list(zip(queries, results))[:20]:
+            query = query.lower()
+            exhaustive = max(1 - edit_distance(query, key, int(0.3 * max(len(key), len(query)))) / max(len(key), len(query))
+                             for key in keys)
+            agree += abs((result[0][1] if result else 0) - max(exhaustive, 0)) < 1e-9 or (not result and exhaustive < 0.7)
+        logger.info(f"Top score matches an exhaustive scan for {agree}/20 queries")
+
+        # Appending labels changes the file signature, so the next lookup reloads
+        time.sleep(0.01)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("img_new.png,zzqx 5mg 1-1-1\n")
+        logger.info(f"After appending a label: {index.top_k('zzqx 5mg 1-1-1', k=1)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import random
+import re
+import time
+import tracemalloc
+import logging
+from models.entity_extractor import EntityExtractor, _CHAR_FIXES
+from models.lexicon_index import edit_distance
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SYLLABLES = ['a', 'ab', 'ac', 'al', 'am', 'an', 'ar', 'az', 'ce', 'ci', 'co', 'cy', 'da', 'di', 'do', 'fen', 'fl',
+             'ga', 'gl', 'in', 'ix', 'la', 'le', 'li', 'lo', 'ma', 'mi', 'mo', 'na', 'ne', 'ol', 'om', 'ox', 'pa',
+             'pr', 'ra', 're', 'ri', 'ro', 'sa', 'se', 'ta', 'te', 'ti', 'to', 'tr', 'um', 'va', 'vi', 'xa', 'zo']
+
+def synthetic_names(rng, count):
+    names = set()
+    while len(names) < count:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 6)))
+        if rng.random() < 0.1:
+            name += ' ' + ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        names.add(name)
+    return sorted(names)
+
+def misspell(rng, word):
+    position = rng.randrange(len(word))
+    edit = rng.choice(['delete', 'insert', 'replace', 'swap'])
+    if edit == 'delete':
+        return word[:position] + word[position + 1:]
+    if edit == 'insert':
+        return word[:position] + rng.choice('abcdefghjkmnpqrstuvwxyz') + word[position:]
+    if edit == 'replace':
+        return word[:position] + rng.choice('abcdefghjkmnpqrstuvwxyz') + word[position + 1:]
+    if position + 1 < len(word):
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:-1]
+
+def prescription_text(rng, names, lines=30):
+    prescribed = [rng.choice(names) for _ in range(lines)]
+    text = '\n'.join(
+        f"Tab {name.title()} {rng.randint(1, 1000)}mg {rng.choice(['1-0-1', '0-0-1', '1-1-1'])} x 5 days"
+        for name in prescribed
+    )
+    return text, prescribed
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main(num_names=50000, num_queries=200):
+    rng = random.Random(0)
+    names = synthetic_names(rng, num_names)
+
+    extractor, build_time = timed(EntityExtractor, names)
+    tracemalloc.start()
+    # A second extractor built while tracing, kept alive until the memory is read
+    measured = EntityExtractor(names)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    logger.info(f"{num_names} names: index built in {build_time:.1f}s, {index_bytes / 2**20:.0f} MB "
+                f"({measured.matcher.states} automaton states, {len(measured.fuzzy._deletes)} delete keys)")
+
+    # Exact matching: the automaton against the one-regex-per-name approach, on one page
+    page, prescribed = prescription_text(rng, names)
+    # Names are matched with every OCR-confusable character folded
+    folded = page.lower().translate(_CHAR_FIXES)
+    automaton_found, automaton_time = timed(extractor.find_medications, page.lower())
+    assert set(prescribed) <= {name for _, _, name, _ in automaton_found}
+
+    patterns = [re.compile(re.escape(name)) for name in extractor.medications]
+    sample = patterns[:num_names // 50]
+    _, regex_time = timed(lambda: [pattern.search(folded) for pattern in sample])
+    logger.info(f"Exact, 1 page: automaton {automaton_time * 1e3:.1f} ms, per-name regexes "
+                f"~{regex_time * 50 * 1e3:.0f} ms (extrapolated from {len(sample)} names)")
+    for num_pages in (10, 100):
+        text = '\n'.join(prescription_text(rng, names)[0] for _ in range(num_pages))
+        _, elapsed = timed(extractor.extract, text)
+        logger.info(f"Full extraction, {num_pages} pages: {elapsed * 1e3:.1f} ms")
+
+    # Fuzzy matching: SymSpell against a linear edit-distance scan, which must agree
+    single_words = [name for name in extractor.medications if ' ' not in name]
+    queries = [(word, misspell(rng, word)) for word in rng.sample(single_words, num_queries)]
+    recovered = 0
+    start = time.perf_counter()
+    for word, typo in queries:
+        match = extractor.fuzzy.best(typo, 2)
+        recovered += match is not None and match[0] == word
+    symspell_time = (time.perf_counter() - start) / num_queries
+
+    start = time.perf_counter()
+    for word, typo in queries[:20]:
+        distances = [(edit_distance(typo, candidate, 2), candidate) for candidate in single_words]
+        best_distance = min(distances)[0]
+        assert extractor.fuzzy.best(typo, 2)[1] == best_distance
+    scan_time = (time.perf_counter() - start) / 20
+    logger.info(f"Fuzzy lookup: SymSpell {symspell_time * 1e3:.2f} ms, linear scan {scan_time * 1e3:.0f} ms "
+                f"({scan_time / symspell_time:.0f}x); {recovered}/{num_queries} misspellings resolved to the original name")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import time
+import logging
+import cv2
+import numpy as np
+from models.image_preprocessing import PreprocessedImage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def legacy_preprocess(image):
+    """The eager pipeline previously in PrescriptionAnalyzer.preprocess_image"""
+    height, width = image.shape[:2]
+    ratio = 2000 / height
+    image = cv2.resize(image, (int(width * ratio), 2000))
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    images = {
+        'original': image,
+        'gray': gray,
+        'binary_otsu': cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
+        'adaptive_gaussian': cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    }
+    for key in ['gray', 'binary_otsu', 'adaptive_gaussian']:
+        images[key] = cv2.convertScaleAbs(cv2.fastNlMeansDenoising(images[key]), alpha=1.5, beta=0)
+    return images
+
+def synthetic_prescription(height, width, seed=0):
+    """Noisy page with a few lines of printed text"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 235, dtype=np.uint8)
+    scale = height / 400
+    for i, line in enumerate(['Rx', 'Paracetamol 500mg 1-0-1', 'Amoxicillin 250mg 1-1-1', 'Dolo 650mg 0-0-1']):
+        origin = (int(20 * scale), int((60 + i * 80) * scale))
+        cv2.putText(image, line, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.9 * scale, (30, 30, 30), max(1, int(2 * scale)))
+    noise = rng.normal(0, 12, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+def time_call(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    for name, (height, width) in {'small scan': (400, 600), 'phone photo': (3000, 4000)}.items():
+        image = synthetic_prescription(height, width)
+
+        def lazy_all():
+            images = PreprocessedImage(image)
+            for variant in images.VARIANTS:
+                images[variant]
+
+        results = {
+            'legacy, all variants': time_call(lambda: legacy_preprocess(image)),
+            'lazy, all variants': time_call(lazy_all),
+            'lazy, gray only': time_call(lambda: PreprocessedImage(image)['gray'])
+        }
+        for label, seconds in results.items():
+            logger.info(f"{name:<12} {width}x{height} {label:<22} {seconds:8.2f} s")
+
+if __name__ == "__main__":
+    main()
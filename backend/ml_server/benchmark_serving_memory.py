@@ -0,0 +1,86 @@
+"""Memory per serving worker: each worker loading its own models vs serve.py's preload + fork.
+
+Measured with 4 workers after one disease prediction and one CRNN decode
+each (Linux, 1 CPU, torch 2.14, scikit-learn 1.6; EasyOCR not installed,
+so its detector and recognizer weights are not part of either figure):
+
+    load per worker : 472.6 MB private per worker, 2273.0 MB PSS for 4 workers
+    preload + fork  :  25.2 MB private per worker,  511.1 MB PSS for 4 workers (master 836.9 MB)
+
+So each worker added under serve.py costs about 25 MB instead of about
+470 MB. With EasyOCR installed the gap should grow by the size of its
+weights, which preloading shares as well.
+"""
+import gc
+import os
+import signal
+import logging
+import numpy as np
+
+os.environ.setdefault('ML_WARMUP_ON_START', '0')
+import app as ml_app
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def memory_mb(pid):
+    """Private (unshared) and proportional set size of a process, from /proc (Linux only)"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+def load_components():
+    for component in ml_app.COMPONENTS.values():
+        component.get()
+
+def handle_requests():
+    """Serve one request per model so workers touch the pages they use"""
+    client = ml_app.app.test_client()
+    client.post('/api/ml/predict-disease', json={'symptoms': ['itching', 'skin_rash']})
+    ml_app.prescription_analyzer.get()._extract_text_crnn(np.full((64, 256, 3), 255, dtype=np.uint8))
+
+def start_worker(load_in_worker):
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_read)
+        if load_in_worker:
+            load_components()
+        handle_requests()
+        os.write(ready_write, b'1')
+        signal.pause()
+        os._exit(0)
+    os.close(ready_write)
+    os.read(ready_read, 1)
+    os.close(ready_read)
+    return pid
+
+def measure(num_workers, preload):
+    pids = [start_worker(load_in_worker=not preload) for _ in range(num_workers)]
+    usage = [memory_mb(pid) for pid in pids]
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    private = sum(u[0] for u in usage) / num_workers
+    pss = sum(u[1] for u in usage)
+    return private, pss
+
+def main(num_workers=4):
+    # Workers that load their own models: nothing is shared
+    private, pss = measure(num_workers, preload=False)
+    logger.info(f"load per worker : {private:8.1f} MB private per worker, {pss:8.1f} MB PSS for {num_workers} workers")
+
+    # serve.py: load once in the master, freeze, then fork
+    load_components()
+    gc.freeze()
+    master_private, master_pss = memory_mb(os.getpid())
+    private, pss = measure(num_workers, preload=True)
+    logger.info(f"preload + fork  : {private:8.1f} MB private per worker, {pss:8.1f} MB PSS for {num_workers} workers "
+                f"(master {master_private:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import cv2
+import pytesseract
+from models.backpressure import QueueFull
+from models import metrics
+from models.prescription_analyzer import TESSERACT_CONFIG, TESSERACT_VARIANTS
+
+logger = logging.getLogger(__name__)
+
+async def run_tesseract(png_bytes, config=TESSERACT_CONFIG, timeout=60):
+    """Run the tesseract CLI as an asyncio subprocess, feeding the image on stdin"""
+    process = await asyncio.create_subprocess_exec(
+        pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', *config.split(),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(png_bytes), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode('utf-8', errors='replace').strip())
+    return stdout.decode('utf-8', errors='replace')
+
+def _encode_png(images, img_type):
+    ok, encoded = cv2.imencode('.png', images[img_type])
+    if not ok:
+        raise ValueError(f"Could not encode {img_type} image")
+    return encoded.tobytes()
+
+class AsyncPrescriptionOCR:
+    """The fan-out OCR pipeline of PrescriptionAnalyzer on an event loop.
+
+    Preprocessing, EasyOCR and CRNN run on the bounded cpu executor and
+    Tesseract runs as async subprocesses under tesseract_limiter, so a
+    request waiting on OCR holds no thread. QueueFull cancels the request's
+    other jobs and propagates to the caller; any other failing job is
+    logged and skipped like in the sync path.
+    """
+
+    def __init__(self, analyzer, cpu_executor, tesseract_limiter):
+        self.analyzer = analyzer
+        self.cpu = cpu_executor
+        self.tesseract = tesseract_limiter
+
+    async def _tesseract_job(self, images, img_type):
+        png_bytes = await self.cpu.run(_encode_png, images, img_type)
+        with metrics.span(f"ocr.tesseract:{img_type}"):
+            return await self.tesseract.run(run_tesseract, png_bytes, TESSERACT_CONFIG, self.analyzer.ocr_job_timeout)
+
+    def _easyocr_job(self, images):
+        with metrics.span('ocr.easyocr'):
+            return self.analyzer._run_easyocr(images['original'])
+
+    async def _guarded(self, name, job):
+        """Await one OCR job with the analyzer's per-job timeout; None if it fails"""
+        try:
+            return await asyncio.wait_for(job, self.analyzer.ocr_job_timeout)
+        except QueueFull:
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"OCR job {name} timed out after {self.analyzer.ocr_job_timeout}s")
+            self.analyzer._record_dropped_job(name, 'timeout')
+        except Exception as e:
+            logger.error(f"OCR error in {name}: {str(e)}")
+            self.analyzer._record_dropped_job(name, 'error')
+        return None
+
+    async def extract_text(self, image):
+        images = await self.cpu.run(self.analyzer.preprocess_image, image)
+        jobs = [self._guarded('easyocr', self.cpu.run(self._easyocr_job, images))]
+        for img_type in TESSERACT_VARIANTS:
+            jobs.append(self._guarded(f"tesseract:{img_type}", self._tesseract_job(images, img_type)))
+        tasks = [asyncio.ensure_future(job) for job in jobs]
+        try:
+            easyocr_result, *tesseract_texts = await asyncio.gather(*tasks)
+        except BaseException:
+            # gather leaves the siblings of a failed job running; cancel them so a
+            # rejected request gives back the capacity backpressure is protecting
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return self.analyzer._merge_ocr_results(easyocr_result, tesseract_texts)
+
+    async def extract_text_details(self, image, mode=None):
+        """Async counterpart of PrescriptionAnalyzer.extract_text_details"""
+        mode = mode or self.analyzer.ocr_mode
+        if mode != 'fanout':
+            # Cascade stages run one after another anyway, so use the sync path on a worker
+            return await self.cpu.run(self.analyzer.extract_text_details, image, mode)
+
+        with metrics.span('ocr.fanout'):
+            ocr_text, stage = await self.extract_text(image), 'fanout'
+        if not ocr_text.strip():
+            ocr_text, stage = await self.cpu.run(self.analyzer._extract_text_crnn, image), 'crnn'
+        self.analyzer._record_stage(mode, stage)
+        return {'text': ocr_text, 'mode': mode, 'stage': stage}
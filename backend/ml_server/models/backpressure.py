@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import threading
+
+class QueueFull(RuntimeError):
+    """Raised when a bounded executor or limiter has no free slot; served as 429"""
+
+    def __init__(self, name):
+        super().__init__(f"{name} queue is full")
+        self.name = name
+
+class BoundedExecutor:
+    """Thread pool that rejects work instead of queueing it without limit.
+
+    At most max_workers jobs run and max_queue more wait; submit() raises
+    QueueFull beyond that so callers can shed load.
+    """
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _release(self, _):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(self.name)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # Run in a copy of the caller's context, as asyncio.to_thread does
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected
+            }
+
+class AsyncLimiter:
+    """Caps concurrent coroutines (e.g. subprocesses) with a bounded wait queue, on one event loop"""
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.capacity = max_concurrent + max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def run(self, coro_fn, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise QueueFull(self.name)
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                return await coro_fn(*args)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'max_workers': self.max_concurrent,
+            'capacity': self.capacity,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,119 @@
+import torch
+
+# Two independent rolling hashes identify a prefix when merging beams
+_HASH_BASE = (131, 137)
+_HASH_MOD = (2147483647, 2147483629)
+
+class CTCDecoder:
+    """Greedy and prefix beam search CTC decoding over batched log-probabilities.
+
+    Both modes take log_probs shaped [batch, time, classes] (the CRNN output
+    after log_softmax) and return one string per batch item. Repeated labels
+    are collapsed and blanks removed; blank defaults to 0 to match the
+    nn.CTCLoss used in training.
+    """
+
+    MODES = ('greedy', 'beam')
+
+    def __init__(self, char_list, blank=0, beam_size=5, mode='beam'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown CTC decoding mode: {mode}")
+        self.char_list = char_list
+        self.blank = blank
+        self.beam_size = beam_size
+        self.mode = mode
+
+    def decode(self, log_probs):
+        if self.mode == 'greedy':
+            return self.greedy(log_probs)
+        return self.beam_search(log_probs)
+
+    def _to_text(self, tokens):
+        return ''.join(self.char_list[t] for t in tokens if t != self.blank and t < len(self.char_list))
+
+    def greedy(self, log_probs):
+        """Best path decoding: argmax per step, then collapse repeats and drop blanks"""
+        best = log_probs.argmax(dim=2)
+        keep = best != self.blank
+        keep[:, 1:] &= best[:, 1:] != best[:, :-1]
+        return [self._to_text(row[mask].tolist()) for row, mask in zip(best, keep)]
+
+    def beam_search(self, log_probs):
+        """CTC prefix beam search, vectorized over batch, beams and classes"""
+        log_probs = log_probs.detach().float().cpu()
+        batch, steps, classes = log_probs.shape
+        beams = self.beam_size
+        neg_inf = float('-inf')
+
+        # Beam state; only beam 0 starts alive, the rest hold -inf scores
+        tokens = torch.zeros(batch, beams, steps, dtype=torch.long)
+        lengths = torch.zeros(batch, beams, dtype=torch.long)
+        last = torch.full((batch, beams), -1, dtype=torch.long)
+        hashes = torch.zeros(batch, beams, 2, dtype=torch.long)
+        p_blank = torch.full((batch, beams), neg_inf)
+        p_blank[:, 0] = 0.0
+        p_label = torch.full((batch, beams), neg_inf)
+
+        labels = torch.arange(classes)
+        bases = torch.tensor(_HASH_BASE)
+        mods = torch.tensor(_HASH_MOD)
+        # Extended prefix hashes depend only on the parent hash and the label
+        label_terms = (labels + 1).view(1, 1, classes, 1)
+
+        for t in range(steps):
+            step = log_probs[:, t]  # [batch, classes]
+            total = torch.logaddexp(p_blank, p_label)
+
+            # Candidates that keep the prefix: emit blank, or repeat the last label
+            same_blank = total + step[:, self.blank].unsqueeze(1)
+            repeat = step.gather(1, last.clamp(min=0))
+            same_label = torch.where(last >= 0, p_label + repeat, torch.full_like(p_label, neg_inf))
+
+            # Candidates that append a label; a repeat needs a blank in between
+            is_repeat = labels.view(1, 1, classes) == last.unsqueeze(2)
+            source = torch.where(is_repeat, p_blank.unsqueeze(2), total.unsqueeze(2))
+            extend_label = source + step.unsqueeze(1)
+            extend_label[:, :, self.blank] = neg_inf
+
+            # An extension that spells an existing live beam (beam i + c == beam j)
+            # is merged into that beam instead of competing with it
+            alive = torch.isfinite(total)
+            to_beam = (hashes.unsqueeze(2) * bases + (last.unsqueeze(1) + 1).unsqueeze(3)) % mods
+            match = (to_beam == hashes.unsqueeze(1)).all(dim=3)
+            match &= (alive & (last >= 0)).unsqueeze(1)
+            last_index = last.clamp(min=0).unsqueeze(1).expand(-1, beams, -1)
+            merged = torch.where(match, extend_label.gather(2, last_index), torch.full_like(match, neg_inf, dtype=extend_label.dtype))
+            same_label = torch.logaddexp(same_label, merged.logsumexp(dim=1))
+            killed = torch.zeros_like(extend_label).scatter_reduce(2, last_index, match.float(), reduce='amax')
+            extend_label = extend_label.masked_fill(killed > 0, neg_inf)
+
+            # Flatten [same prefix | extensions] per batch item and keep the best
+            cand_blank = torch.cat([same_blank, torch.full((batch, beams * classes), neg_inf)], dim=1)
+            cand_label = torch.cat([same_label, extend_label.reshape(batch, -1)], dim=1)
+            extend_hashes = (hashes.unsqueeze(2) * bases + label_terms) % mods
+            cand_hashes = torch.cat([hashes, extend_hashes.reshape(batch, -1, 2)], dim=1)
+            top = torch.logaddexp(cand_blank, cand_label).topk(beams, dim=1).indices
+
+            # Rebuild beam state from the chosen candidates
+            parent = torch.where(top < beams, top, (top - beams) // classes)
+            label = torch.where(top < beams, torch.full_like(top, -1), (top - beams) % classes)
+
+            tokens = tokens.gather(1, parent.unsqueeze(2).expand(-1, -1, steps)).clone()
+            lengths = lengths.gather(1, parent)
+            parent_last = last.gather(1, parent)
+            appended = label >= 0
+            slot = lengths.clamp(max=steps - 1).unsqueeze(2)
+            current = tokens.gather(2, slot).squeeze(2)
+            tokens.scatter_(2, slot, torch.where(appended, label, current).unsqueeze(2))
+            lengths = lengths + appended.long()
+            last = torch.where(appended, label, parent_last)
+            hashes = cand_hashes.gather(1, top.unsqueeze(2).expand(-1, -1, 2))
+            p_blank = cand_blank.gather(1, top)
+            p_label = cand_label.gather(1, top)
+
+        best = torch.logaddexp(p_blank, p_label).argmax(dim=1)
+        results = []
+        for b in range(batch):
+            k = int(best[b])
+            results.append(self._to_text(tokens[b, k, :int(lengths[b, k])].tolist()))
+        return results
@@ -5,31 +5,194 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 import joblib
 import os
+import threading
 import logging
+from models.knowledge_base import SymptomKnowledgeBase
+from models.forest_engine import CompiledForest
+from models.prediction_cache import PredictionCache
+from models.model_registry import ModelRegistry
+from models import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class ModelState:
+    """Everything a prediction needs from one artifact, swapped in as a single reference"""
+
+    def __init__(self, model, label_encoder, symptoms_list, inference_backend, version=None, engine=None):
+        # Artifacts fitted on a DataFrame remember the column names, which makes
+        # sklearn warn on every NumPy input. The names only fix the column order.
+        feature_names = getattr(model, 'feature_names_in_', None)
+        if feature_names is not None:
+            symptoms_list = [str(name) for name in feature_names]
+            del model.feature_names_in_
+
+        self.model = model
+        self.label_encoder = label_encoder
+        self.symptoms_list = symptoms_list
+        self.symptom_index = {symptom: i for i, symptom in enumerate(symptoms_list)}
+        self.version = version
+
+        # Compile the fitted forest when the compiled backend is selected
+        if inference_backend == 'compiled' and engine is None:
+            engine = CompiledForest(model)
+        self.engine = engine if inference_backend == 'compiled' else None
+
 class DiseasePredictor:
-    def __init__(self):
-        self.model = None
+    INFERENCE_BACKENDS = ('sklearn', 'compiled')
+    # Past roughly this many rows sklearn's parallel C traversal is faster
+    COMPILED_MAX_BATCH = 100
+
+    def __init__(self, inference_backend=None):
+        self.inference_backend = inference_backend or os.getenv('DISEASE_INFERENCE_BACKEND', 'sklearn')
+        if self.inference_backend not in self.INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {self.inference_backend}")
+        # Readers take self.state once per request; writers build a new
+        # ModelState and replace the reference, so a swap never blocks predictions
+        self.state = None
+        self._swap_lock = threading.Lock()
         self.le = LabelEncoder()
         self.symptoms_list = None
         self.base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.model_path = os.path.join(self.base_path, 'models', 'disease_prediction_model.joblib')
+        self.registry = ModelRegistry(
+            os.path.join(self.base_path, 'models', 'registry'),
+            prefix='disease_prediction_model'
+        )
+        # Uncompressed artifacts are memory-mapped, so forked serving workers share one copy
+        self.mmap_mode = os.getenv('DISEASE_MODEL_MMAP', 'r') or None
+        self.knowledge_base = SymptomKnowledgeBase(os.path.join(self.base_path, 'data'))
+        self.cache = PredictionCache(
+            max_size=int(os.getenv('DISEASE_CACHE_SIZE', 4096)),
+            ttl=float(os.getenv('DISEASE_CACHE_TTL', 0)) or None
+        )
         self.load_or_train_model()
 
+    @property
+    def model(self):
+        return self.state.model if self.state else None
+
+    @property
+    def engine(self):
+        return self.state.engine if self.state else None
+
+    @property
+    def symptom_index(self):
+        return self.state.symptom_index if self.state else {}
+
+    @property
+    def version(self):
+        return self.state.version if self.state else None
+
     def load_or_train_model(self):
+        active = self.registry.active
         if os.path.exists(self.model_path):
-            self.load_model()
+            # A model file the registry has never seen (e.g. retrained offline)
+            # becomes the active version; otherwise keep the recorded one
+            version = self.registry.file_hash(self.model_path)[:12]
+            if version not in self.registry:
+                self.register_model(self.model_path)
+                active = version
+            elif active is None:
+                active = version
+        if active is not None and os.path.exists(self.registry.artifact_path(active)):
+            self.activate_version(active)
         else:
             self.train_model()
 
-    def load_model(self):
-        model_data = joblib.load(self.model_path)
-        self.model = model_data['model']
-        self.le = model_data['label_encoder']
-        self.symptoms_list = model_data['symptoms_list']
+    def _artifact_metadata(self, path):
+        model_data = joblib.load(path)
+        return {
+            'n_symptoms': len(model_data['symptoms_list']),
+            'n_classes': len(model_data['label_encoder'].classes_)
+        }
+
+    def _swap_state(self, state):
+        self.state = state
+        self.le = state.label_encoder
+        self.symptoms_list = state.symptoms_list
+        # Entries are keyed by version, so clearing only frees memory
+        self.cache.clear()
+        logger.info(f"Active disease model version: {state.version}")
+
+    def _engine_path(self, version):
+        return os.path.join(self.registry.registry_dir, f"{self.registry.prefix}-{version}.engine.joblib")
+
+    def _load_engine(self, model, version):
+        """Compiled forest for a registered version, memory-mapped from its cached arrays"""
+        if self.inference_backend != 'compiled' or version is None:
+            return None
+        # Registry versions are immutable, so the cached arrays never go stale
+        engine_path = self._engine_path(version)
+        if not os.path.exists(engine_path):
+            CompiledForest(model).save(engine_path)
+        return CompiledForest.load(engine_path, mmap_mode=self.mmap_mode)
+
+    def load_model(self, path=None, version=None):
+        """Load an artifact into a new ModelState and swap it in"""
+        model_data = joblib.load(path or self.model_path, mmap_mode=self.mmap_mode)
+        state = ModelState(
+            model_data['model'],
+            model_data['label_encoder'],
+            model_data['symptoms_list'],
+            self.inference_backend,
+            version=version,
+            engine=self._load_engine(model_data['model'], version)
+        )
+        self._swap_state(state)
+        return state
+
+    def activate_version(self, version):
+        """Hot-swap to a registered model version while requests keep being served"""
+        with self._swap_lock, self.registry.locked():
+            self.registry.get(version)
+            self.load_model(self.registry.artifact_path(version), version=version)
+            self.registry.mark_active(version)
+        return version
+
+    def rollback(self):
+        """Reactivate the version that was active before the current one"""
+        # The registry stays locked from reading the history to writing it
+        with self._swap_lock, self.registry.locked():
+            version = self.registry.previous()
+            if version is None:
+                raise ValueError("No previous model version to roll back to")
+            self.load_model(self.registry.artifact_path(version), version=version)
+            self.registry.mark_rolled_back(version)
+        return version
+
+    def sync_with_registry(self):
+        """Swap in the registry's active version if another process changed it; returns whether it did"""
+        self.registry.refresh()
+        with self._swap_lock:
+            active = self.registry.active
+            if active is None or active == self.version or not os.path.exists(self.registry.artifact_path(active)):
+                return False
+            self.load_model(self.registry.artifact_path(active), version=active)
+        return True
+
+    def register_model(self, path=None, activate=False):
+        """Add an artifact (the default model file if no path) to the registry"""
+        path = path or self.model_path
+        version = self.registry.register(path, self._artifact_metadata(path))
+        if activate:
+            self.activate_version(version)
+        return version
+
+    def _predict_proba(self, state, X):
+        if state.engine is not None and len(X) <= self.COMPILED_MAX_BATCH:
+            return state.engine.predict_proba(X)
+        return state.model.predict_proba(X)
+
+    def _refresh_knowledge_base(self):
+        """Pick up edited CSVs without a restart, dropping predictions built from the old tables"""
+        if self.knowledge_base.reload_if_changed():
+            self.cache.clear()
+
+    def _cache_key(self, state, symptoms, top_k):
+        """Canonical key: the set of known normalized symptoms, which fully determines the features"""
+        normalized = (symptom.strip().lower() for symptom in symptoms)
+        return state.version, frozenset(s for s in normalized if s in state.symptom_index), top_k
 
     def clean_symptom(self, symptom):
         """Clean symptom text by removing extra spaces and standardizing format"""
@@ -51,7 +214,12 @@ class DiseasePredictor:
         symptom = '_'.join(symptom.split())
         return replacements.get(symptom, symptom)
 
-    def preprocess_data(self):
+    def preprocess_data(self, sparse=False):
+        """Build the severity-weighted feature matrix and encoded targets.
+
+        Returns a DataFrame with one column per symptom, or a scipy CSR matrix
+        in the same column order when sparse is True.
+        """
         try:
             # Load datasets with proper paths
             dataset_path = os.path.join(self.base_path, 'data', 'dataset.csv')
@@ -71,31 +239,45 @@ class DiseasePredictor:
             severity_dict = severity_df.set_index('Symptom')['weight'].to_dict()
 
             # Get unique symptoms
+            symptom_columns = [col for col in df.columns if col.startswith('Symptom_')]
             symptoms = []
-            for col in df.columns:
-                if col.startswith('Symptom_'):
-                    # Clean symptoms in the dataset
-                    df[col] = df[col].str.strip().str.lower() if df[col].dtype == object else df[col]
-                    symptoms.extend(df[col].dropna().unique())
+            for col in symptom_columns:
+                # Clean symptoms in the dataset
+                df[col] = df[col].str.strip().str.lower() if pd.api.types.is_string_dtype(df[col].dtype) else df[col]
+                symptoms.extend(df[col].dropna().unique())
             
             self.symptoms_list = list(set(symptoms))
             logger.info(f"Total unique symptoms: {len(self.symptoms_list)}")
 
-            # Create features matrix
-            X = pd.DataFrame(0, index=range(len(df)), columns=self.symptoms_list)
-            
-            for i, row in df.iterrows():
-                for col in df.columns:
-                    if col.startswith('Symptom_'):
-                        symptom = row[col]
-                        if pd.notna(symptom):
-                            symptom = symptom.strip().lower()
-                            if symptom in severity_dict:
-                                X.loc[i, symptom] = severity_dict[symptom]
-                            else:
-                                logger.warning(f"Symptom '{symptom}' not found in severity data")
-
-            # Prepare target variable
+            # Scatter every (row, symptom) pair into the matrix in one pass
+            column_index = {symptom: i for i, symptom in enumerate(self.symptoms_list)}
+            pairs = df[symptom_columns].stack()
+            rows = pairs.index.get_level_values(0).to_numpy()
+            columns = pairs.map(column_index).to_numpy(dtype=np.int64)
+            weights = pairs.map(severity_dict)
+
+            for symptom in pairs[weights.isna()].unique():
+                logger.warning(f"Symptom '{symptom}' not found in severity data")
+            weights = weights.fillna(0).to_numpy(dtype=np.int64)
+
+            shape = (len(df), len(self.symptoms_list))
+            if sparse:
+                from scipy.sparse import csr_matrix
+
+                # A symptom listed twice in a row must not be summed
+                known = weights != 0
+                keys, first = np.unique(rows[known] * shape[1] + columns[known], return_index=True)
+                X = csr_matrix(
+                    (weights[known][first], (keys // shape[1], keys % shape[1])),
+                    shape=shape
+                )
+            else:
+                X = np.zeros(shape, dtype=np.int64)
+                X[rows, columns] = weights
+                X = pd.DataFrame(X, columns=self.symptoms_list)
+
+            # Prepare target variable; a fresh encoder never mutates the serving one
+            self.le = LabelEncoder()
             y = self.le.fit_transform(df['Disease'])
             
             logger.info(f"Features matrix shape: {X.shape}")
@@ -111,76 +293,159 @@ class DiseasePredictor:
         try:
             logger.info("Starting model training...")
             X, y = self.preprocess_data()
+            X = X.to_numpy(dtype=np.float32)
             
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             
             logger.info("Training Random Forest Classifier...")
-            self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.model.fit(X_train, y_train)
+            model = RandomForestClassifier(n_estimators=100, random_state=42)
+            model.fit(X_train, y_train)
             
             # Calculate and log accuracy
-            train_accuracy = self.model.score(X_train, y_train)
-            test_accuracy = self.model.score(X_test, y_test)
+            train_accuracy = model.score(X_train, y_train)
+            test_accuracy = model.score(X_test, y_test)
             logger.info(f"Training accuracy: {train_accuracy:.2%}")
             logger.info(f"Testing accuracy: {test_accuracy:.2%}")
 
             # Save the model
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
             joblib.dump({
-                'model': self.model,
+                'model': model,
                 'label_encoder': self.le,
                 'symptoms_list': self.symptoms_list
             }, self.model_path)
             logger.info(f"Model saved to: {self.model_path}")
 
+            # Register the new artifact and swap it in
+            with self._swap_lock, self.registry.locked():
+                version = self.registry.register(self.model_path, {
+                    'n_symptoms': len(self.symptoms_list),
+                    'n_classes': len(self.le.classes_),
+                    'train_accuracy': train_accuracy,
+                    'test_accuracy': test_accuracy
+                })
+                self._swap_state(ModelState(
+                    model, self.le, self.symptoms_list, self.inference_backend, version=version
+                ))
+                self.registry.mark_active(version)
+
         except Exception as e:
             logger.error(f"Error in training model: {str(e)}")
             raise
 
-    def predict_disease(self, symptoms):
+    def _build_feature_vector(self, symptoms, state=None):
+        """Build the float32 severity vector for a list of symptoms"""
+        state = state or self.state
+        X = np.zeros(len(state.symptoms_list), dtype=np.float32)
+        severity_dict = self.knowledge_base.severity
+
+        for symptom in symptoms:
+            symptom = symptom.strip().lower()
+            index = state.symptom_index.get(symptom)
+            if index is not None:
+                if symptom in severity_dict:
+                    X[index] = severity_dict[symptom]
+                else:
+                    logger.warning(f"Severity not found for symptom: {symptom}")
+
+        return X
+
+    def _format_prediction(self, state, probabilities, top_k=1):
+        """Turn one row of class probabilities into a prediction with a top-k differential"""
+        # Highest probability first; zero-probability classes are not a differential
+        ranked = np.argsort(-probabilities, kind='stable')[:max(1, top_k)]
+        ranked = [int(i) for i in ranked if probabilities[i] > 0] or [int(ranked[0])]
+
+        differential = []
+        for i in ranked:
+            disease = state.label_encoder.classes_[state.model.classes_[i]]
+            differential.append({
+                'disease': disease,
+                'description': self.knowledge_base.get_description(disease),
+                'precautions': self.knowledge_base.get_precautions(disease),
+                'probability': float(probabilities[i])
+            })
+
+        best = differential[0]
+        return {
+            'disease': best['disease'],
+            'description': best['description'],
+            'precautions': best['precautions'],
+            'confidence': best['probability'],
+            'differential': differential
+        }
+
+    def predict_disease(self, symptoms, top_k=1):
+        """Predict the most likely disease and the top_k differential from one predict_proba call"""
         try:
-            if not self.model:
+            state = self.state
+            if state is None:
                 raise Exception("Model not loaded")
 
-            # Create feature vector
-            X = pd.DataFrame(0, index=[0], columns=self.symptoms_list)
-            severity_df = pd.read_csv(os.path.join(self.base_path, 'data', 'Symptom-severity.csv'))
-            severity_dict = severity_df.set_index('Symptom')['weight'].to_dict()
+            self._refresh_knowledge_base()
 
-            # Process symptoms
-            for symptom in symptoms:
-                symptom = symptom.strip().lower()
-                if symptom in self.symptoms_list:
-                    if symptom in severity_dict:
-                        X.loc[0, symptom] = severity_dict[symptom]
-                    else:
-                        logger.warning(f"Severity not found for symptom: {symptom}")
+            with metrics.span('disease.cache_lookup'):
+                key = self._cache_key(state, symptoms, top_k)
+                prediction = self.cache.get(key)
+            if prediction is not None:
+                return prediction
 
             # Make prediction
-            prediction = self.model.predict(X)
-            probabilities = self.model.predict_proba(X)
-            disease = self.le.inverse_transform(prediction)[0]
-            confidence = float(probabilities.max())
+            with metrics.span('disease.features'):
+                X = self._build_feature_vector(symptoms, state).reshape(1, -1)
+            with metrics.span('disease.forest'):
+                probabilities = self._predict_proba(state, X)[0]
 
-            # Get description and precautions
-            description_df = pd.read_csv(os.path.join(self.base_path, 'data', 'symptom_Description.csv'))
-            precaution_df = pd.read_csv(os.path.join(self.base_path, 'data', 'symptom_precaution.csv'))
+            with metrics.span('disease.format'):
+                prediction = self._format_prediction(state, probabilities, top_k)
+            self.cache.put(key, prediction)
+            return prediction
 
-            description = description_df[
-                description_df['Disease'].str.lower() == disease.lower()
-            ]['Description'].values[0]
+        except Exception as e:
+            logger.error(f"Error in prediction: {str(e)}")
+            raise
 
-            precautions = precaution_df[
-                precaution_df['Disease'].str.lower() == disease.lower()
-            ].iloc[0, 1:].dropna().tolist()
+    def predict_diseases_batch(self, symptom_lists, top_k=1):
+        """Predict diseases for many symptom lists with a single predict_proba call.
 
-            return {
-                'disease': disease,
-                'description': description,
-                'precautions': precautions,
-                'confidence': confidence
-            }
+        Returns one entry per input, in order, holding either the prediction
+        or the error that made that item invalid.
+        """
+        try:
+            state = self.state
+            if state is None:
+                raise Exception("Model not loaded")
+
+            self._refresh_knowledge_base()
+
+            results = [None] * len(symptom_lists)
+            rows = []
+            pending = []
+            with metrics.span('disease.batch_features'):
+                for i, symptoms in enumerate(symptom_lists):
+                    if not isinstance(symptoms, list) or not all(isinstance(s, str) for s in symptoms):
+                        results[i] = {'success': False, 'error': 'Symptoms must be a list of strings'}
+                        continue
+                    key = self._cache_key(state, symptoms, top_k)
+                    prediction = self.cache.get(key)
+                    if prediction is not None:
+                        results[i] = {'success': True, 'prediction': prediction}
+                        continue
+                    rows.append(self._build_feature_vector(symptoms, state))
+                    pending.append((i, key))
+
+            # Only cache misses go through the model
+            if rows:
+                with metrics.span('disease.batch_forest'):
+                    probabilities = self._predict_proba(state, np.vstack(rows))
+                with metrics.span('disease.batch_format'):
+                    for (i, key), row in zip(pending, probabilities):
+                        prediction = self._format_prediction(state, row, top_k)
+                        self.cache.put(key, prediction)
+                        results[i] = {'success': True, 'prediction': prediction}
+
+            return results
 
         except Exception as e:
-            logger.error(f"Error in prediction: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error in batch prediction: {str(e)}")
+            raise
@@ -0,0 +1,365 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import logging
+import os
+import sqlite3
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from models.prediction_cache import PredictionCache
+from models import metrics
+
+logger = logging.getLogger(__name__)
+
+# Term types in the order a name should resolve to them: ingredients, then brands, then drugs
+TTY_RANK = {'IN': 0, 'PIN': 1, 'MIN': 2, 'BN': 3, 'SCD': 4, 'SBD': 5, 'GPCK': 6, 'BPCK': 7, 'SY': 8, 'TMSY': 9}
+SYNONYM_TTYS = ('SY', 'TMSY')
+# SQLite's default limit on bound parameters per statement is 999
+MAX_PARAMETERS = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS concepts (
+    rxcui TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    synonym TEXT NOT NULL DEFAULT '',
+    tty TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS names (
+    name_key TEXT NOT NULL,
+    rxcui TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (name_key, rxcui)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS interactions (
+    rxcui TEXT NOT NULL,
+    other_rxcui TEXT NOT NULL,
+    other_name TEXT NOT NULL DEFAULT '',
+    severity TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (rxcui, other_rxcui)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+# Bumped in the same transaction as each write, so readers in any process see it
+BUMP_VERSION = 'INSERT INTO versions VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1'
+
+def normalize_name(name):
+    return ' '.join(str(name).lower().split())
+
+def _chunks(items, size=MAX_PARAMETERS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_drug_group(rxnav_data):
+    """Concept details from an RxNav /drugs response: the first concept of the first group"""
+    concept_group = rxnav_data['drugGroup']['conceptGroup'][0]
+    concept_properties = concept_group.get('conceptProperties', [{}])[0]
+    return {
+        "rxcui": concept_properties.get('rxcui', ''),
+        "name": concept_properties.get('name', ''),
+        "synonym": concept_properties.get('synonym', ''),
+        "tty": concept_properties.get('tty', '')
+    }
+
+def parse_interactions(data):
+    """Interacting drugs from an RxNav /interaction response"""
+    interactions = []
+    for group in data.get('interactionTypeGroup', []):
+        for interaction in group['interactionType']:
+            for pair in interaction['interactionPair']:
+                other = pair['interactionConcept'][1]['minConceptItem']
+                interactions.append({
+                    'rxcui': other.get('rxcui', ''),
+                    'drug': other['name'],
+                    'severity': pair.get('severity', ''),
+                    'description': pair.get('description', '')
+                })
+    return interactions
+
+class RxNavClient:
+    """Pooled HTTP client for the RxNav REST API, or any server that mimics it at base_url"""
+
+    def __init__(self, base_url, timeout=5.0, pool_size=8, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests = 0
+        self.errors = 0
+
+    def _get(self, path, params):
+        self.requests += 1
+        try:
+            with metrics.span('drugs.http'):
+                response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"RxNav request {path} failed: {str(e)}")
+            return None
+
+    # Both lookups return None when the request failed, as opposed to an
+    # empty result when RxNav answered that it knows nothing
+
+    def find_drug(self, name):
+        data = self._get('drugs.json', {'name': name})
+        if data is None:
+            return None
+        if not data.get('drugGroup', {}).get('conceptGroup'):
+            return {}
+        return parse_drug_group(data)
+
+    def interactions(self, rxcui):
+        data = self._get('interaction/interaction.json', {'rxcui': rxcui})
+        return parse_interactions(data) if data is not None else None
+
+class DrugKnowledgeBase:
+    """Drug names and interactions served from a local SQLite store.
+
+    The store is bulk-loaded from an RxNorm release (RXNCONSO.RRF) and an
+    interactions CSV, and memory-mapped by SQLite. Results go through an
+    LRU in front of it, so repeated drugs cost a dict lookup, and batches
+    of misses are resolved with one indexed query each. When a base URL is
+    configured, drugs the store does not know are fetched from RxNav over a
+    pooled session and written back. Only answers are cached; a failed
+    request is remembered for failure_ttl seconds so an outage does not
+    cost every lookup a timeout, then retried.
+    """
+
+    def __init__(self, db_path, base_url=None, cache_size=4096, timeout=5.0, pool_size=8, mmap_size=256 * 2**20,
+                 failure_ttl=30.0):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache = PredictionCache(max_size=cache_size)
+        self.failures = PredictionCache(max_size=cache_size, ttl=failure_ttl)
+        self.client = RxNavClient(base_url, timeout=timeout, pool_size=pool_size) if base_url else None
+        self._fetch_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='rxnav') if base_url else None
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """One connection per thread; SQLite connections are not shared across threads"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.connection = connection
+        return connection
+
+    # Bulk loading
+
+    def load_rxnconso(self, path, batch_size=50000):
+        """Load concepts and their names from RXNCONSO.RRF, keeping current RxNorm atoms"""
+        concepts = {}
+        names = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('|')
+                rxcui, sab, tty, name, suppress = fields[0], fields[11], fields[12], fields[14], fields[16]
+                if sab != 'RXNORM' or suppress not in ('N', ''):
+                    continue
+                rank = TTY_RANK.get(tty, len(TTY_RANK))
+                concept = concepts.setdefault(rxcui, {'name': name, 'tty': tty, 'rank': rank, 'synonym': ''})
+                if rank < concept['rank']:
+                    concept.update(name=name, tty=tty, rank=rank)
+                if tty in SYNONYM_TTYS and not concept['synonym']:
+                    concept['synonym'] = name
+                names[(normalize_name(name), rxcui)] = None
+
+        concept_rows = [(rxcui, c['name'], c['synonym'], c['tty']) for rxcui, c in concepts.items()]
+        name_rows = [(name_key, rxcui, concepts[rxcui]['rank']) for name_key, rxcui in names]
+        with self._write_lock, self.connection() as connection:
+            for rows in _chunks(concept_rows, batch_size):
+                connection.executemany('INSERT OR REPLACE INTO concepts VALUES (?, ?, ?, ?)', rows)
+            for rows in _chunks(name_rows, batch_size):
+                connection.executemany('INSERT OR REPLACE INTO names VALUES (?, ?, ?)', rows)
+        self.cache.clear()
+        logger.info(f"Loaded {len(concept_rows)} RxNorm concepts and {len(name_rows)} names from {path}")
+        return len(concept_rows)
+
+    def load_interactions(self, path):
+        """Load an interactions CSV (rxcui_a, rxcui_b, severity, description; optional name_a, name_b)"""
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                a, b = record['rxcui_a'].strip(), record['rxcui_b'].strip()
+                severity, description = record.get('severity') or '', record.get('description') or ''
+                rows.append((a, b, record.get('name_b') or '', severity, description))
+                rows.append((b, a, record.get('name_a') or '', severity, description))
+        with self._write_lock, self.connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO interactions VALUES (?, ?, ?, ?, ?)', rows)
+            connection.execute(BUMP_VERSION, ('interactions',))
+        self.cache.clear()
+        logger.info(f"Loaded {len(rows) // 2} interacting pairs from {path}")
+        return len(rows) // 2
+
+    def version(self, table):
+        """Write counter of a table, for readers that keep a copy of it"""
+        rows = self.connection().execute('SELECT version FROM versions WHERE name = ?', (table,)).fetchall()
+        return rows[0][0] if rows else 0
+
+    # Lookups
+
+    def _query_drugs(self, name_keys):
+        found = {}
+        for chunk in _chunks(name_keys):
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection().execute(
+                f"SELECT n.name_key, c.rxcui, c.name, c.synonym, c.tty FROM names n "
+                f"JOIN concepts c ON c.rxcui = n.rxcui WHERE n.name_key IN ({placeholders}) "
+                f"ORDER BY n.rank, c.rxcui",
+                chunk
+            )
+            for name_key, rxcui, name, synonym, tty in rows:
+                found.setdefault(name_key, {'rxcui': rxcui, 'name': name, 'synonym': synonym, 'tty': tty})
+        return found
+
+    def _query_interactions(self, rxcuis):
+        found = {rxcui: [] for rxcui in rxcuis}
+        for chunk in _chunks(rxcuis):
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection().execute(
+                f"SELECT i.rxcui, i.other_rxcui, COALESCE(NULLIF(i.other_name, ''), c.name, ''), i.severity, i.description "
+                f"FROM interactions i LEFT JOIN concepts c ON c.rxcui = i.other_rxcui "
+                f"WHERE i.rxcui IN ({placeholders}) ORDER BY i.rxcui, i.other_rxcui",
+                chunk
+            )
+            for rxcui, other_rxcui, other_name, severity, description in rows:
+                found[rxcui].append({
+                    'rxcui': other_rxcui,
+                    'drug': other_name,
+                    'severity': severity,
+                    'description': description
+                })
+        return found
+
+    def _fetch(self, fn, kind, keys):
+        """Call fn for each key on the HTTP pool; keys that fail, or failed recently, are left out"""
+        if self.client is None:
+            return {}
+        keys = [key for key in keys if self.failures.get((kind, key)) is None]
+        if not keys:
+            return {}
+        results = dict(zip(keys, self._fetch_pool.map(fn, keys)))
+        for key, value in results.items():
+            if value is None:
+                self.failures.put((kind, key), True)
+        return {key: value for key, value in results.items() if value is not None}
+
+    def _store_drugs(self, fetched):
+        concept_rows = [(d['rxcui'], d['name'], d['synonym'], d['tty']) for d in fetched.values() if d and d['rxcui']]
+        name_rows = [(name_key, d['rxcui'], TTY_RANK.get(d['tty'], len(TTY_RANK)))
+                     for name_key, d in fetched.items() if d and d['rxcui']]
+        if concept_rows:
+            with self._write_lock, self.connection() as connection:
+                connection.executemany('INSERT OR IGNORE INTO concepts VALUES (?, ?, ?, ?)', concept_rows)
+                connection.executemany('INSERT OR IGNORE INTO names VALUES (?, ?, ?)', name_rows)
+
+    def _store_interactions(self, fetched):
+        rows = [(rxcui, i['rxcui'], i['drug'], i['severity'], i['description'])
+                for rxcui, interactions in fetched.items() for i in interactions if i['rxcui']]
+        if rows:
+            with self._write_lock, self.connection() as connection:
+                connection.executemany('INSERT OR IGNORE INTO interactions VALUES (?, ?, ?, ?, ?)', rows)
+                connection.execute(BUMP_VERSION, ('interactions',))
+
+    def find_drugs(self, names, fetch=True):
+        """Map each name to its concept details, or None when it is unknown.
+
+        With fetch=False only the store is consulted, e.g. on a request path
+        that must not wait on RxNav. Names are cached as unknown only when
+        RxNav (or, without RxNav, the store) confirms it, never when the
+        lookup was skipped or failed.
+        """
+        with metrics.span('drugs.lookup'):
+            keys = {name: normalize_name(name) for name in names}
+            results = {}
+            missing = []
+            for name_key in dict.fromkeys(keys.values()):
+                cached = self.cache.get(('drug', name_key))
+                if cached is not None:
+                    results[name_key] = cached or None
+                else:
+                    missing.append(name_key)
+
+            if missing:
+                found = self._query_drugs(missing)
+                if fetch:
+                    fetched = self._fetch(self.client.find_drug if self.client else None, 'drug',
+                                          [name_key for name_key in missing if name_key not in found])
+                    self._store_drugs(fetched)
+                    found.update(fetched)
+                for name_key in missing:
+                    # Confirmed unknown names are cached as {} so they are not looked up again
+                    if name_key in found or (fetch and self.client is None):
+                        self.cache.put(('drug', name_key), found.get(name_key) or {})
+                    results[name_key] = found.get(name_key) or None
+
+            return {name: results[name_key] for name, name_key in keys.items()}
+
+    def interactions_for(self, rxcuis):
+        """Map each rxcui to the drugs it interacts with"""
+        with metrics.span('drugs.interactions'):
+            results = {}
+            missing = []
+            for rxcui in dict.fromkeys(rxcuis):
+                cached = self.cache.get(('interactions', rxcui))
+                if cached is not None:
+                    results[rxcui] = cached
+                else:
+                    missing.append(rxcui)
+
+            if missing:
+                found = self._query_interactions(missing)
+                # Only drugs the store has nothing on are worth a request
+                fetched = self._fetch(self.client.interactions if self.client else None, 'interactions',
+                                      [rxcui for rxcui in missing if not found[rxcui]])
+                self._store_interactions(fetched)
+                found.update(fetched)
+                for rxcui in missing:
+                    # No interactions is only cached once RxNav, or without RxNav the store, says so
+                    if found[rxcui] or rxcui in fetched or self.client is None:
+                        self.cache.put(('interactions', rxcui), found[rxcui])
+                    results[rxcui] = found[rxcui]
+
+            return results
+
+    def stats(self):
+        stats = {'cache': self.cache.stats(), 'failures': self.failures.stats()}
+        if self.client is not None:
+            stats['http'] = {
+                'base_url': self.client.base_url,
+                'requests': self.client.requests,
+                'errors': self.client.errors
+            }
+        return stats
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Bulk-load the offline drug knowledge store')
+    parser.add_argument('--db', default=os.getenv('RXNORM_DB_PATH', 'data/rxnorm.sqlite3'))
+    parser.add_argument('--rxnconso', help='RXNCONSO.RRF from an RxNorm release')
+    parser.add_argument('--interactions', help='CSV with rxcui_a, rxcui_b, severity, description')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    knowledge = DrugKnowledgeBase(args.db)
+    if args.rxnconso:
+        knowledge.load_rxnconso(args.rxnconso)
+    if args.interactions:
+        knowledge.load_interactions(args.interactions)
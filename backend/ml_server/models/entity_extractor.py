@@ -0,0 +1,135 @@
+import re
+from models.lexicon_index import AhoCorasick, SymSpell
+
+# Characters OCR confuses with digits, and the unit spellings it mangles
+_CHAR_FIXES = str.maketrans({'l': '1', 'i': '1', 'o': '0', 'O': '0', '|': '1', 'I': '1'})
+# Confusable characters are read as digits only where a number is expected: in
+# an x-x-x frequency, in a run holding a real digit, or right before a dosage
+# unit. Folding them everywhere turned the 'ml' unit into 'm1' and every word
+# into a string of digits
+_DIGIT_CONTEXT = re.compile(
+    r'(?<![A-Za-z0-9])[01lioO|I](?:[ \t]*-[ \t]*[01lioO|I]){2}(?![A-Za-z0-9])'
+    r'|(?=[0-9]*[lioO|I])(?=[lioO|I]*[0-9])[0-9lioO|I]+'
+    r'|(?<![A-Za-z])[lioO|I]+(?=[ \t]*(?i:mg|ml|g)(?![A-Za-z]))'
+)
+_UNIT_FIXES = {'mg.': 'mg', 'mgs': 'mg', 'ML': 'ml', 'Ml': 'ml'}
+_UNIT_PATTERN = re.compile('|'.join(re.escape(unit) for unit in _UNIT_FIXES))
+_CASE_FIXES = str.maketrans({'G': 'g'})
+
+DEFAULT_MEDICATIONS = ('paracetamol', 'dolo', 'crocin')
+
+_LETTERS = frozenset('abcdefghijklmnopqrstuvwxyz')
+_WORD = re.compile(r'[a-z0-9]*[a-z][a-z0-9]*')
+_SPACES = re.compile(r'[ \t]+')
+
+def fold_ocr_text(text):
+    """Map OCR-confusable characters in numbers, and unit spellings, to one canonical form"""
+    text = _DIGIT_CONTEXT.sub(lambda match: match.group().translate(_CHAR_FIXES), text)
+    text = _UNIT_PATTERN.sub(lambda match: _UNIT_FIXES[match.group()], text)
+    return text.translate(_CASE_FIXES)
+
+class OrderedSet(dict):
+    """Insertion-ordered set with O(1) membership, built on dict"""
+
+    def add(self, item):
+        self[item] = None
+
+    def to_list(self):
+        return list(self)
+
+class EntityExtractor:
+    """Finds medications, dosages and frequencies in the OCR-folded text.
+
+    Dosages and frequencies are alternatives of a single compiled regex with
+    named groups. Medications come from a lexicon of any size: an
+    Aho-Corasick automaton finds exact names in one pass, and words it does
+    not cover are looked up in a SymSpell index to catch misspelled names.
+    Names and text are matched with every confusable character folded to a
+    digit, so 'paracetamol' also matches an OCR'd 'paracetam0l', and are
+    reported by their canonical (lowercased) name.
+    """
+
+    def __init__(self, medications=DEFAULT_MEDICATIONS, fuzzy_max_distance=2):
+        self.medications = {}
+        for name in medications:
+            name = ' '.join(name.lower().split())
+            if name:
+                self.medications.setdefault(name.translate(_CHAR_FIXES), name)
+        self.matcher = AhoCorasick(self.medications)
+        self.fuzzy_max_distance = fuzzy_max_distance
+        self.fuzzy = None
+        if fuzzy_max_distance > 0:
+            self.fuzzy = SymSpell((name for name in self.medications if ' ' not in name), fuzzy_max_distance)
+        self.pattern = re.compile('|'.join([
+            r'(?P<dosage>\d+[ \t]*(?:mg|ml|g))',
+            r'(?P<frequency>[01][ \t]*-[ \t]*[01][ \t]*-[ \t]*[01])'
+        ]))
+
+    def _allowed_distance(self, word):
+        # Short words sit within one or two edits of too many names
+        if len(word) < 5:
+            return 0
+        return min(self.fuzzy_max_distance, 1 if len(word) < 8 else 2)
+
+    def find_medications(self, text):
+        """(start, end, canonical name, edit distance) for each medication, in text order.
+
+        text is lowercased and single-spaced. Names are matched on a folded
+        copy, but word boundaries are checked on the original characters,
+        so the 'il' of 'crocinil' does not pass for digits after 'crocin'.
+        """
+        folded = text.translate(_CHAR_FIXES)
+        candidates = []
+        for start, end, index in self.matcher.iter(folded):
+            before = text[start - 1] if start else ' '
+            after = text[end] if end < len(text) else ' '
+            if not (before in _LETTERS or after in _LETTERS):
+                candidates.append((start, end, index))
+
+        # Leftmost-longest, non-overlapping
+        candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+        found = []
+        covered_until = 0
+        for start, end, index in candidates:
+            if start >= covered_until:
+                found.append((start, end, self.medications[self.matcher.keys[index]], 0))
+                covered_until = end
+
+        if self.fuzzy is not None:
+            # Exact matches are in text order, so one sweep finds the words they cover
+            exact_spans = [(start, end) for start, end, _, _ in found]
+            span = 0
+            lookups = {}
+            for word in _WORD.finditer(folded):
+                while span < len(exact_spans) and exact_spans[span][1] <= word.start():
+                    span += 1
+                if span < len(exact_spans) and exact_spans[span][0] < word.end():
+                    continue
+                term = word.group()
+                if term not in lookups:
+                    max_distance = self._allowed_distance(term)
+                    match = self.fuzzy.best(term, max_distance) if max_distance else None
+                    # The name must be long enough for the distance too, or
+                    # 'crocinil' would pass for 'crocin' two edits away
+                    if match is not None and match[1] > self._allowed_distance(match[0]):
+                        match = None
+                    lookups[term] = match
+                match = lookups[term]
+                if match is not None:
+                    found.append((word.start(), word.end(), self.medications[match[0]], match[1]))
+            found.sort()
+        return found
+
+    def extract(self, text):
+        text = text.lower()
+        folded = fold_ocr_text(text)
+        entities = {'medications': OrderedSet(), 'dosages': OrderedSet(), 'frequencies': OrderedSet()}
+        # Multi-word names are stored single-spaced
+        for _, _, name, _ in self.find_medications(_SPACES.sub(' ', text)):
+            entities['medications'].add(name)
+        for match in self.pattern.finditer(folded):
+            if match.lastgroup == 'dosage':
+                entities['dosages'].add(match.group())
+            else:
+                entities['frequencies'].add(''.join(match.group().split()))
+        return {kind: found.to_list() for kind, found in entities.items()}
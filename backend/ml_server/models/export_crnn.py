@@ -0,0 +1,103 @@
+import copy
+import os
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+if __package__:
+    from models.prescription_analyzer import CRNN, char_list
+    from models.ctc_decoder import CTCDecoder
+else:
+    # Run as a script from the models directory
+    from prescription_analyzer import CRNN, char_list
+    from ctc_decoder import CTCDecoder
+
+WEIGHTS_PATH = 'models/crnn_model_best.pth'
+EXPORT_PATH = 'models/crnn_model_quantized.pt'
+
+def fold_batchnorm(model):
+    """Copy of model with every Conv2d -> BatchNorm2d pair in model.cnn fused into one Conv2d"""
+    model = copy.deepcopy(model).eval()
+    layers = list(model.cnn)
+    folded = []
+    i = 0
+    while i < len(layers):
+        layer = layers[i]
+        if isinstance(layer, nn.Conv2d) and i + 1 < len(layers) and isinstance(layers[i + 1], nn.BatchNorm2d):
+            folded.append(fuse_conv_bn_eval(layer, layers[i + 1]))
+            i += 2
+        else:
+            folded.append(layer)
+            i += 1
+    model.cnn = nn.Sequential(*folded)
+    return model
+
+def quantize(model):
+    """Dynamic int8 quantization of the LSTM and Linear layers; the convolutions stay float"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+def build_inference_model(model, fold_bn=True, int8=True):
+    """Apply the export optimizations to an eager CRNN and trace it to TorchScript"""
+    model = model.eval()
+    if fold_bn:
+        model = fold_batchnorm(model)
+    if int8:
+        model = quantize(model)
+    with torch.inference_mode():
+        # Batch size is read from the input at run time, so the trace works for any batch
+        return torch.jit.trace(model, torch.zeros(2, 1, 32, 128))
+
+def load_eager_model(weights_path=WEIGHTS_PATH):
+    model = CRNN(num_chars=len(char_list))
+    model.load_state_dict(torch.load(weights_path, map_location='cpu'))
+    return model.eval()
+
+def export_crnn(weights_path=WEIGHTS_PATH, output_path=EXPORT_PATH, fold_bn=True, int8=True):
+    """Export the trained CRNN to a TorchScript artifact that PrescriptionAnalyzer loads when present"""
+    if not os.path.exists(weights_path):
+        raise Exception(f"No trained model found at {weights_path}")
+
+    scripted = build_inference_model(load_eager_model(weights_path), fold_bn=fold_bn, int8=int8)
+    torch.jit.save(scripted, output_path)
+    print(f"Exported CRNN to {output_path} (fold_bn={fold_bn}, int8={int8})")
+    return scripted
+
+def check_parity(eager, exported, labels_file='data/train_labels.txt', image_dir='data/train_images', batch_size=32):
+    """Decode every training sample with both models.
+
+    Returns how often the exported model's text matches the eager model's,
+    and each model's exact-match accuracy against the labels.
+    """
+    if __package__:
+        from models.train_crnn import PrescriptionDataset, get_transforms
+    else:
+        from train_crnn import PrescriptionDataset, get_transforms
+
+    dataset = PrescriptionDataset(image_dir, labels_file, transform=get_transforms())
+    decoder = CTCDecoder(char_list)
+    agree = eager_correct = exported_correct = 0
+
+    with torch.inference_mode():
+        for start in range(0, len(dataset), batch_size):
+            indices = range(start, min(start + batch_size, len(dataset)))
+            images = torch.stack([dataset[i][0] for i in indices])
+            labels = [dataset.samples[i][1] for i in indices]
+            eager_texts = decoder.decode(eager(images).log_softmax(2))
+            exported_texts = decoder.decode(exported(images).log_softmax(2))
+            for label, eager_text, exported_text in zip(labels, eager_texts, exported_texts):
+                agree += eager_text == exported_text
+                eager_correct += eager_text == label
+                exported_correct += exported_text == label
+
+    total = max(len(dataset), 1)
+    return {
+        'samples': len(dataset),
+        'agreement': agree / total,
+        'eager_accuracy': eager_correct / total,
+        'exported_accuracy': exported_correct / total
+    }
+
+if __name__ == '__main__':
+    exported = export_crnn()
+    report = check_parity(load_eager_model(), exported)
+    print(f"Parity on {report['samples']} training samples: {report['agreement']:.1%} identical, "
+          f"accuracy eager {report['eager_accuracy']:.1%} vs exported {report['exported_accuracy']:.1%}")
@@ -0,0 +1,98 @@
+import numpy as np
+import joblib
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CompiledForest:
+    """Flattened RandomForestClassifier evaluated with vectorized NumPy traversal.
+
+    Every tree's nodes are concatenated into contiguous arrays, and all
+    (row, tree) pairs still inside a tree are advanced one level per step, so
+    there are no per-tree or per-row Python loops.
+    """
+
+    def __init__(self, forest):
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        features, thresholds, lefts, rights, values, leaves = [], [], [], [], [], []
+        roots = []
+        offset = 0
+        self.max_depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            roots.append(offset)
+            leaves.append(is_leaf)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # Older sklearn stores class counts, newer stores fractions
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis=1, keepdims=True))
+
+            offset += tree.node_count
+            self.max_depth = max(self.max_depth, tree.max_depth)
+
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.is_leaf = np.concatenate(leaves)
+        self.classes_ = forest.classes_
+
+        logger.info(
+            f"Compiled forest: {len(self.roots)} trees, {offset} nodes, max depth {self.max_depth}"
+        )
+
+    # Everything predict_proba needs; saved so workers can memory-map one copy
+    ARRAYS = ('roots', 'feature', 'threshold', 'left', 'right', 'value', 'is_leaf', 'classes_')
+
+    def save(self, path):
+        """Write the flattened arrays uncompressed, so load() can memory-map them"""
+        data = {name: getattr(self, name) for name in self.ARRAYS}
+        data['max_depth'] = self.max_depth
+        tmp_path = f"{path}.tmp"
+        joblib.dump(data, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Rebuild a compiled forest from save(); with mmap_mode the arrays stay in the page cache"""
+        data = joblib.load(path, mmap_mode=mmap_mode)
+        engine = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(engine, name, data[name])
+        engine.max_depth = data['max_depth']
+        return engine
+
+    def predict_proba(self, X):
+        """Average leaf class fractions over all trees, matching sklearn's predict_proba"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        n_rows, n_trees = X.shape[0], len(self.roots)
+        node = np.tile(self.roots, n_rows)
+        row = np.repeat(np.arange(n_rows), n_trees)
+
+        # Only (row, tree) pairs that have not reached a leaf are advanced
+        active = np.flatnonzero(~self.is_leaf[node])
+        while active.size:
+            current = node[active]
+            go_left = X[row[active], self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+
+        node = node.reshape(n_rows, n_trees)
+        return self.value[node].mean(axis=1)
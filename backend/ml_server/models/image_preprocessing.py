@@ -0,0 +1,90 @@
+from collections.abc import Mapping
+import threading
+import cv2
+from models import metrics
+
+def limit_resolution(image, max_dimension):
+    """Downscale so the longer side is at most max_dimension; never upscale"""
+    if not max_dimension:
+        return image
+    height, width = image.shape[:2]
+    scale = max_dimension / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+class PreprocessedImage(Mapping):
+    """The OCR variants of one image, computed on first access and memoized.
+
+    Variants form a small graph: the grayscale image is denoised once and the
+    contrast-enhanced gray, Otsu and adaptive threshold variants are all
+    derived from that, so fastNlMeansDenoising runs at most once per image.
+    Each node has its own lock and cached nodes are read without one, so a
+    job asking for the original image never waits behind another's denoising.
+    """
+
+    VARIANTS = ('original', 'gray', 'binary_otsu', 'adaptive_gaussian')
+
+    def __init__(self, image, max_dimension=2000):
+        self._source = image
+        self.max_dimension = max_dimension
+        self._cache = {}
+        self._builders = {
+            'original': self._original,
+            'grayscale': self._grayscale,
+            'denoised': self._denoised,
+            'gray': self._gray,
+            'binary_otsu': self._binary_otsu,
+            'adaptive_gaussian': self._adaptive_gaussian
+        }
+        # A node's lock is held while it builds its inputs; the graph has no
+        # cycles, so locks are always taken in dependency order
+        self._locks = {name: threading.Lock() for name in self._builders}
+
+    def _get(self, name):
+        value = self._cache.get(name)
+        if value is not None:
+            return value
+        with self._locks[name]:
+            value = self._cache.get(name)
+            if value is None:
+                with metrics.span(f"preprocess.{name}"):
+                    value = self._builders[name]()
+                self._cache[name] = value
+            return value
+
+    def _original(self):
+        return limit_resolution(self._source, self.max_dimension)
+
+    def _grayscale(self):
+        return cv2.cvtColor(self._get('original'), cv2.COLOR_BGR2GRAY)
+
+    def _denoised(self):
+        return cv2.fastNlMeansDenoising(self._get('grayscale'))
+
+    def _gray(self):
+        return cv2.convertScaleAbs(self._get('denoised'), alpha=1.5, beta=0)
+
+    def _binary_otsu(self):
+        return cv2.threshold(self._get('denoised'), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+    def _adaptive_gaussian(self):
+        return cv2.adaptiveThreshold(
+            self._get('denoised'), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        )
+
+    def __getitem__(self, name):
+        if name not in self.VARIANTS:
+            raise KeyError(name)
+        return self._get(name)
+
+    def __iter__(self):
+        return iter(self.VARIANTS)
+
+    def __len__(self):
+        return len(self.VARIANTS)
+
+    def computed(self):
+        """Names of the nodes built so far, including intermediate ones"""
+        return list(self._cache)
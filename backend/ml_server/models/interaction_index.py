@@ -0,0 +1,143 @@
+import csv
+import logging
+import os
+import threading
+from itertools import combinations
+
+logger = logging.getLogger(__name__)
+
+# Most severe first; unknown labels sort last
+SEVERITY_RANK = {'contraindicated': 0, 'high': 1, 'major': 1, 'moderate': 2, 'minor': 3, 'low': 3}
+
+def severity_rank(severity):
+    return SEVERITY_RANK.get(str(severity).strip().lower(), len(SEVERITY_RANK))
+
+class InteractionIndex:
+    """Sparse drug-interaction adjacency keyed by rxcui.
+
+    Each rxcui maps to a dict of the rxcuis it interacts with, holding
+    (severity, description) once per unordered pair, so checking a whole
+    prescription is one dict probe per pair of its drugs. The source, a CSV
+    (rxcui_a, rxcui_b, severity, description) or the interactions table of
+    a DrugKnowledgeBase, is reloaded when it changes: the first load happens
+    inline, later ones on a background thread while lookups keep using the
+    previous adjacency until the new one is swapped in.
+    """
+
+    def __init__(self, path=None, rows=(), knowledge=None):
+        self.path = path
+        self.knowledge = knowledge
+        self._adjacency = {}
+        self._signature = None
+        self._loaded = False
+        self._rebuild = None
+        self._lock = threading.Lock()
+        if rows:
+            self._adjacency = self._build(rows)
+
+    @staticmethod
+    def _build(rows):
+        adjacency = {}
+        for a, b, severity, description in rows:
+            a, b = str(a).strip(), str(b).strip()
+            if not a or not b or a == b:
+                continue
+            # Store each pair once, under the smaller rxcui; keep the more severe entry
+            low, high = min(a, b), max(a, b)
+            entry = (severity or '', description or '')
+            current = adjacency.setdefault(low, {}).get(high)
+            if current is None or severity_rank(entry[0]) < severity_rank(current[0]):
+                adjacency[low][high] = entry
+        return adjacency
+
+    @classmethod
+    def from_store(cls, knowledge):
+        """Track the interactions table of a DrugKnowledgeBase, rebuilding in the background after each write to it"""
+        return cls(knowledge=knowledge)
+
+    def _read_rows(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [
+                (record['rxcui_a'], record['rxcui_b'], record.get('severity'), record.get('description'))
+                for record in csv.DictReader(f)
+            ]
+
+    def _read_store(self):
+        # Bulk loads store both directions of a pair but RxNav results only
+        # the queried one, so every row is read and _build folds them together
+        return self.knowledge.connection().execute(
+            'SELECT rxcui, other_rxcui, severity, description FROM interactions'
+        ).fetchall()
+
+    def _source_signature(self):
+        if self.knowledge is not None:
+            return self.knowledge.version('interactions')
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _load(self, signature):
+        """Build the adjacency of the source as of signature, then swap it in"""
+        if self.knowledge is not None:
+            adjacency = self._build(self._read_store())
+            source = self.knowledge.db_path
+        elif signature is None:
+            logger.warning(f"Interactions file {self.path} not found")
+            adjacency, source = {}, None
+        else:
+            adjacency = self._build(self._read_rows())
+            source = self.path
+        # Readers hold whichever dict they fetched, so the swap needs no lock
+        self._adjacency = adjacency
+        self._signature = signature
+        self._loaded = True
+        if source is not None:
+            logger.info(f"Indexed {self._count()} interacting pairs from {source}")
+
+    def _load_in_background(self, signature):
+        try:
+            self._load(signature)
+        except Exception as e:
+            # The next refresh retries; lookups keep the previous adjacency
+            logger.error(f"Error rebuilding the interaction index: {str(e)}")
+
+    def refresh(self):
+        """Return the current adjacency, starting a reload if the source changed"""
+        if not self.path and self.knowledge is None:
+            return self._adjacency
+        signature = self._source_signature()
+        if signature == self._signature:
+            return self._adjacency
+
+        with self._lock:
+            if not self._loaded:
+                self._load(signature)
+            elif signature != self._signature and (self._rebuild is None or not self._rebuild.is_alive()):
+                # The signature is read before the rows, so a write landing
+                # during the rebuild is picked up by the next one
+                self._rebuild = threading.Thread(
+                    target=self._load_in_background, args=(signature,),
+                    name='interaction-index', daemon=True
+                )
+                self._rebuild.start()
+            return self._adjacency
+
+    def _count(self):
+        return sum(len(others) for others in self._adjacency.values())
+
+    def __len__(self):
+        self.refresh()
+        return self._count()
+
+    def pairs(self, rxcuis):
+        """Every interacting pair among rxcuis as (a, b, severity, description), most severe first"""
+        adjacency = self.refresh()
+        found = []
+        for a, b in combinations(sorted(set(rxcuis)), 2):
+            entry = adjacency.get(a, {}).get(b)
+            if entry is not None:
+                found.append((a, b) + entry)
+        found.sort(key=lambda pair: (severity_rank(pair[2]), pair[0], pair[1]))
+        return found
@@ -0,0 +1,104 @@
+import pandas as pd
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SymptomKnowledgeBase:
+    """In-memory lookup tables for symptom severity, disease descriptions and precautions"""
+
+    SEVERITY_FILE = 'Symptom-severity.csv'
+    DESCRIPTION_FILE = 'symptom_Description.csv'
+    PRECAUTION_FILE = 'symptom_precaution.csv'
+
+    def __init__(self, data_dir, check_interval=5.0):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self.severity = {}
+        self.descriptions = {}
+        self.precautions = {}
+        self._mtimes = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _paths(self):
+        return [os.path.join(self.data_dir, name)
+                for name in (self.SEVERITY_FILE, self.DESCRIPTION_FILE, self.PRECAUTION_FILE)]
+
+    def _current_mtimes(self):
+        return {path: os.path.getmtime(path) for path in self._paths()}
+
+    @staticmethod
+    def normalize(name):
+        """Normalize a symptom or disease name to its lookup key"""
+        return str(name).strip().lower()
+
+    def reload(self):
+        """Read the CSV files and rebuild every lookup table"""
+        try:
+            severity_path, description_path, precaution_path = self._paths()
+            mtimes = self._current_mtimes()
+
+            severity_df = pd.read_csv(severity_path)
+            severity = {
+                self.normalize(symptom): int(weight)
+                for symptom, weight in zip(severity_df['Symptom'], severity_df['weight'])
+            }
+
+            description_df = pd.read_csv(description_path)
+            descriptions = {
+                self.normalize(disease): description
+                for disease, description in zip(description_df['Disease'], description_df['Description'])
+            }
+
+            precaution_df = pd.read_csv(precaution_path)
+            precautions = {}
+            for row in precaution_df.itertuples(index=False):
+                precautions[self.normalize(row[0])] = [p for p in row[1:] if pd.notna(p)]
+
+            # Swap all tables together so readers never see a half-built state
+            with self._lock:
+                self.severity = severity
+                self.descriptions = descriptions
+                self.precautions = precautions
+                self._mtimes = mtimes
+                self._last_check = time.monotonic()
+
+            logger.info(
+                f"Loaded knowledge base: {len(severity)} symptoms, "
+                f"{len(descriptions)} descriptions, {len(precautions)} precaution sets"
+            )
+
+        except Exception as e:
+            logger.error(f"Error loading knowledge base: {str(e)}")
+            raise
+
+    def reload_if_changed(self):
+        """Reload the tables when any CSV file changed since the last load"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        try:
+            if self._current_mtimes() == self._mtimes:
+                return False
+        except OSError as e:
+            logger.warning(f"Could not stat knowledge base files: {str(e)}")
+            return False
+
+        logger.info("Knowledge base files changed, reloading")
+        self.reload()
+        return True
+
+    def get_severity(self, symptom):
+        return self.severity.get(self.normalize(symptom))
+
+    def get_description(self, disease):
+        return self.descriptions.get(self.normalize(disease), '')
+
+    def get_precautions(self, disease):
+        return list(self.precautions.get(self.normalize(disease), []))
@@ -0,0 +1,211 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_Index = namedtuple('_Index', ['labels', 'keys', 'lengths', 'codes', 'gram_ids', 'offsets', 'postings'])
+
+def _normalize(text):
+    return ' '.join(text.lower().split())
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def batch_edit_distance(query, codes, lengths):
+    """Optimal string alignment distance from query to every row of codes at once.
+
+    codes holds one zero-padded string of character codes per row. The DP
+    runs one query character at a time over all rows and stores each cell
+    minus its column, which turns the left-to-right insertion chain into a
+    running minimum.
+    """
+    rows, width = codes.shape
+    query_codes = np.array([ord(char) for char in query], dtype=codes.dtype)
+    # Diagonal step costs (0 on a match, 1 otherwise) and transposition costs
+    # for every query character up front, both shifted by the column change
+    diagonal = (codes[None, :, :] != query_codes[:, None, None]).astype(np.int32) - 1
+    swaps = np.zeros(len(query), dtype=bool)
+    transposition = np.full((len(query), rows, max(width - 1, 0)), width + len(query), dtype=np.int32)
+    if len(query) > 1:
+        swapped = (codes[None, :, :-1] == query_codes[1:, None, None]) & (codes[None, :, 1:] == query_codes[:-1, None, None])
+        transposition[1:][swapped] = -1
+        swaps[1:] = swapped.any(axis=(1, 2))
+
+    previous = np.zeros((rows, width + 1), dtype=np.int32)
+    before_previous = previous.copy()
+    current = np.empty_like(previous)
+    for i in range(len(query)):
+        current[:, 0] = i + 1
+        np.minimum(previous[:, 1:] + 1, previous[:, :-1] + diagonal[i], out=current[:, 1:])
+        if swaps[i]:
+            np.minimum(current[:, 2:], before_previous[:, :-2] + transposition[i], out=current[:, 2:])
+        np.minimum.accumulate(current, axis=1, out=current)
+        before_previous, previous, current = previous, current, before_previous
+    return previous[np.arange(rows), lengths] + lengths
+
+class LabelIndex:
+    """Nearest-label lookup over a labels file ('image,text' per line).
+
+    Labels are loaded once into a trigram inverted index stored as CSR
+    numpy arrays and reloaded when the file's mtime or size changes. A
+    query counts shared trigrams for every label with one bincount, which
+    bounds each label's edit distance from below, then computes exact
+    distances with a vectorized kernel, closest bound first, until no
+    remaining label can enter the top k. Scores are 1 - distance / longer
+    length; at most candidate_limit labels are rescored per query.
+    """
+
+    def __init__(self, path, candidate_limit=256, block_size=32, stop_fraction=0.05):
+        self.path = path
+        self.candidate_limit = candidate_limit
+        self.block_size = block_size
+        self.stop_fraction = stop_fraction
+        self._signature = None
+        self._index = self._build([])
+        self._lock = threading.Lock()
+
+    def _read_labels(self):
+        labels = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split(',', 1)
+                if len(parts) == 2 and parts[1].strip():
+                    labels.append(parts[1].strip())
+        return labels
+
+    @staticmethod
+    def _build(labels):
+        unique = {}
+        for label in labels:
+            unique.setdefault(_normalize(label), label)
+        keys = list(unique)
+
+        postings_by_gram = {}
+        for label_id, key in enumerate(keys):
+            for gram in _trigrams(key):
+                postings_by_gram.setdefault(gram, []).append(label_id)
+        gram_ids = {gram: gram_id for gram_id, gram in enumerate(postings_by_gram)}
+        sizes = np.fromiter((len(ids) for ids in postings_by_gram.values()), dtype=np.int64, count=len(gram_ids))
+        offsets = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        for gram_id, ids in enumerate(postings_by_gram.values()):
+            postings[offsets[gram_id]:offsets[gram_id + 1]] = ids
+
+        lengths = np.fromiter((len(key) for key in keys), dtype=np.int32, count=len(keys))
+        codes = np.zeros((len(keys), int(lengths.max(initial=0))), dtype=np.int32)
+        for label_id, key in enumerate(keys):
+            codes[label_id, :len(key)] = [ord(char) for char in key]
+
+        return _Index(
+            labels=list(unique.values()),
+            keys=keys,
+            lengths=lengths,
+            codes=codes,
+            gram_ids=gram_ids,
+            offsets=offsets,
+            postings=postings
+        )
+
+    def refresh(self):
+        """Reload the labels if the file changed since the last load"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return self._index
+
+        with self._lock:
+            if signature != self._signature:
+                if signature is None:
+                    logger.warning(f"Labels file {self.path} not found")
+                    self._index = self._build([])
+                else:
+                    self._index = self._build(self._read_labels())
+                    logger.info(f"Indexed {len(self._index.keys)} labels from {self.path}")
+                self._signature = signature
+            return self._index
+
+    def __len__(self):
+        return len(self.refresh().keys)
+
+    def top_k(self, text, k=5, min_score=0.0):
+        """Up to k (label, score) pairs with score >= min_score, best first"""
+        index = self.refresh()
+        query = _normalize(text)
+        if not query or not index.keys or k <= 0:
+            return []
+
+        # Count shared trigrams per label. Grams in most labels are assumed
+        # shared by all of them, which only loosens the bound below
+        grams = _trigrams(query)
+        needed = len(grams)
+        rare = []
+        stop_size = max(1, int(len(index.keys) * self.stop_fraction))
+        for gram in grams:
+            gram_id = index.gram_ids.get(gram)
+            if gram_id is None:
+                continue
+            start, end = index.offsets[gram_id], index.offsets[gram_id + 1]
+            if end - start > stop_size:
+                needed -= 1
+            else:
+                rare.append(index.postings[start:end])
+        shared = np.bincount(np.concatenate(rare), minlength=len(index.keys)) if rare else np.zeros(len(index.keys), dtype=np.int64)
+
+        # An edit or transposition touches at most four of the query's
+        # trigrams, so a label missing m of them is at least ceil(m / 4) edits
+        # away. Labels are scored level by level in that bound; no label at
+        # level d or beyond can score above 1 - d / (len(query) + d).
+        level = (needed - shared + 3) // 4
+        labels, scores = [], []
+        evaluated = 0
+        for distance in range(len(query) + 1):
+            if 1.0 - distance / (len(query) + distance) < min_score:
+                break
+            if len(scores) >= k and np.partition(scores, -k)[-k] >= 1.0 - distance / (len(query) + distance):
+                break
+            candidates = np.flatnonzero(level == distance)
+            if not len(candidates):
+                continue
+            # The length difference is a bound too; among equal bounds, labels
+            # sharing more trigrams are likelier to be close
+            lengths = index.lengths[candidates]
+            upper = 1.0 - np.maximum(distance, np.abs(lengths - len(query))) / np.maximum(lengths, len(query))
+            keep = upper >= min_score
+            candidates, upper = candidates[keep], upper[keep]
+            budget = self.candidate_limit - evaluated
+            if len(candidates) > budget:
+                # Bounds differ by far more than 1e-6, so this ranks by bound, then shared
+                priority = np.round(upper * 1e6).astype(np.int64) * (len(grams) + 1) + shared[candidates]
+                best = np.argpartition(-priority, budget)[:budget]
+                candidates, upper = candidates[best], upper[best]
+            order = np.lexsort((-shared[candidates], -upper))
+            candidates, upper = candidates[order], upper[order]
+
+            start, block_size = 0, self.block_size
+            while start < len(candidates) and evaluated < self.candidate_limit:
+                if len(scores) >= k and np.partition(scores, -k)[-k] >= upper[start]:
+                    break
+                block = candidates[start:start + min(block_size, self.candidate_limit - evaluated)]
+                start += len(block)
+                evaluated += len(block)
+                block_size *= 2
+                block_lengths = index.lengths[block]
+                distances = batch_edit_distance(query, index.codes[block, :int(block_lengths.max())], block_lengths)
+                block_scores = 1.0 - distances / np.maximum(block_lengths, len(query))
+                keep = block_scores >= min_score
+                labels.extend(block[keep].tolist())
+                scores.extend(block_scores[keep].tolist())
+            if evaluated >= self.candidate_limit:
+                break
+
+        matches = sorted(((index.labels[label_id], score) for label_id, score in zip(labels, scores)),
+                         key=lambda match: (-match[1], match[0]))
+        return matches[:k]
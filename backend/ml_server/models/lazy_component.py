@@ -0,0 +1,82 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ComponentUnavailable(RuntimeError):
+    """Raised when a component is still loading or failed to load"""
+
+    def __init__(self, component, message):
+        super().__init__(message)
+        self.component = component
+
+class LazyComponent:
+    """A heavy object built on first use or in the background by start().
+
+    The factory runs at most once at a time on a background thread; get()
+    waits for it up to a timeout. A failed load is recorded and retried by
+    the next start() or get().
+    """
+
+    PENDING, LOADING, READY, FAILED = 'pending', 'loading', 'ready', 'failed'
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.state = self.PENDING
+        self.error = None
+        self.load_seconds = None
+        self._instance = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            instance = self.factory()
+        except Exception as e:
+            logger.error(f"Error loading {self.name}: {str(e)}", exc_info=True)
+            with self._lock:
+                self.state = self.FAILED
+                self.error = str(e)
+        else:
+            with self._lock:
+                self._instance = instance
+                self.state = self.READY
+                self.error = None
+            logger.info(f"Loaded {self.name} in {time.perf_counter() - start:.2f}s")
+        self.load_seconds = time.perf_counter() - start
+        self._loaded.set()
+
+    def start(self):
+        """Begin loading in the background unless loaded or already loading"""
+        with self._lock:
+            if self.state in (self.LOADING, self.READY):
+                return
+            self.state = self.LOADING
+            self._loaded.clear()
+        threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def get(self, timeout=None):
+        """The loaded instance, starting the load if needed and waiting up to timeout seconds"""
+        if self.state == self.READY:
+            return self._instance
+        if self.state != self.LOADING:
+            self.start()
+        if not self._loaded.wait(timeout):
+            raise ComponentUnavailable(self.name, f"{self.name} is still loading")
+        if self.state != self.READY:
+            raise ComponentUnavailable(self.name, f"{self.name} failed to load: {self.error}")
+        return self._instance
+
+    def status(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'load_seconds': self.load_seconds
+        }
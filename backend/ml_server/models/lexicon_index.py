@@ -0,0 +1,200 @@
+import csv
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+def load_lexicon(path, column='name'):
+    """Read names from a text file (one per line) or a CSV export with a name column"""
+    if not path or not os.path.exists(path):
+        logger.warning(f"Lexicon file {path} not found")
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            names = [row.get(column) or '' for row in csv.DictReader(f)]
+        else:
+            names = f.read().splitlines()
+    names = [name.strip() for name in names if name.strip()]
+    logger.info(f"Loaded {len(names)} names from {path}")
+    return names
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        char_a = a[i - 1]
+        for j in range(1, len(b) + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else max_distance + 1
+
+class AhoCorasick:
+    """Aho-Corasick automaton matching every key in one pass over the text.
+
+    Transitions live in a single dict keyed by state and character code,
+    which keeps tens of thousands of keys to a few hundred thousand ints.
+    Failure links are followed at match time instead of materializing a full
+    DFA, which is still linear in the text length.
+    """
+
+    _RADIX = 0x110000
+
+    def __init__(self, keys):
+        self.keys = []
+        self._goto = {}
+        self._fail = [0]
+        self._output = {}
+        self._dict_link = {}
+
+        children = [[]]
+        for key in keys:
+            if not key:
+                continue
+            state = 0
+            for char in key:
+                edge = state * self._RADIX + ord(char)
+                next_state = self._goto.get(edge)
+                if next_state is None:
+                    next_state = len(self._fail)
+                    self._goto[edge] = next_state
+                    self._fail.append(0)
+                    children.append([])
+                    children[state].append((ord(char), next_state))
+                state = next_state
+            if state not in self._output:
+                self._output[state] = len(self.keys)
+                self.keys.append(key)
+
+        self._root_codes = frozenset(code for code, _ in children[0])
+
+        # Breadth-first, so every failure target is final before it is used
+        queue = [child for _, child in children[0]]
+        for state in queue:
+            for code, child in children[state]:
+                fail = self._fail[state]
+                while fail and fail * self._RADIX + code not in self._goto:
+                    fail = self._fail[fail]
+                fail = self._goto.get(fail * self._RADIX + code, 0)
+                self._fail[child] = fail
+                link = fail if fail in self._output else self._dict_link.get(fail)
+                if link is not None:
+                    self._dict_link[child] = link
+                queue.append(child)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def states(self):
+        return len(self._fail)
+
+    def iter(self, text):
+        """Yield (start, end, key index) for every occurrence of every key"""
+        goto, fail, output, dict_link, radix = self._goto, self._fail, self._output, self._dict_link, self._RADIX
+        root_codes = self._root_codes
+        state = 0
+        for end, char in enumerate(text, 1):
+            code = ord(char)
+            if not state and code not in root_codes:
+                continue
+            while True:
+                next_state = goto.get(state * radix + code)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            match = state if state in output else dict_link.get(state)
+            while match is not None:
+                index = output[match]
+                yield end - len(self.keys[index]), end, index
+                match = dict_link.get(match)
+
+class SymSpell:
+    """Symmetric delete index for edit-distance lookups.
+
+    Every word is stored under all strings reachable from its prefix by up to
+    max_distance deletions; a query generates its own deletes, so candidates
+    come from a handful of dict hits and only those are verified with
+    edit_distance. Buckets hold a bare word index until they collide.
+    """
+
+    def __init__(self, words, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = []
+        self._deletes = {}
+        seen = set()
+        for word in words:
+            if not word or word in seen:
+                continue
+            seen.add(word)
+            index = len(self.words)
+            self.words.append(word)
+            for delete in self._edits(word[:prefix_length], max_distance):
+                bucket = self._deletes.get(delete)
+                if bucket is None:
+                    self._deletes[delete] = index
+                elif isinstance(bucket, list):
+                    bucket.append(index)
+                else:
+                    self._deletes[delete] = [bucket, index]
+
+    def __len__(self):
+        return len(self.words)
+
+    @staticmethod
+    def _edits(word, max_distance):
+        edits = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {
+                candidate[:i] + candidate[i + 1:]
+                for candidate in frontier if len(candidate) > 1
+                for i in range(len(candidate))
+            } - edits
+            edits |= frontier
+        return edits
+
+    def lookup(self, term, max_distance=None):
+        """All words within max_distance of term as (word, distance), closest first"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        candidates = set()
+        for delete in self._edits(term[:self.prefix_length], max_distance):
+            bucket = self._deletes.get(delete)
+            if bucket is None:
+                continue
+            if isinstance(bucket, list):
+                candidates.update(bucket)
+            else:
+                candidates.add(bucket)
+
+        matches = []
+        for index in candidates:
+            word = self.words[index]
+            distance = edit_distance(term, word, max_distance)
+            if distance <= max_distance:
+                matches.append((word, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def best(self, term, max_distance=None):
+        matches = self.lookup(term, max_distance)
+        return matches[0] if matches else None
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds, from a cache hit to a slow OCR pass
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans of the request being handled, when it asked for timing; None otherwise
+_request_trace = ContextVar('ml_request_trace', default=None)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+stage_duration = Histogram('ml_stage_duration_seconds', 'Time spent in each pipeline stage')
+request_duration = Histogram('ml_request_duration_seconds', 'HTTP request latency by route')
+requests_total = Counter('ml_requests_total', 'HTTP requests by route and status')
+
+_collectors = []
+
+def register_collector(collect):
+    """collect() returns exposition lines for values that live elsewhere, e.g. cache stats"""
+    _collectors.append(collect)
+
+def observe(stage, seconds, trace=None):
+    """Record a stage duration; trace defaults to the current request's, if it asked for timing"""
+    stage_duration.observe(seconds, stage=stage)
+    trace = trace if trace is not None else _request_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def start_trace():
+    """Collect this request's spans; returns a token for end_trace"""
+    return _request_trace.set([])
+
+def current_trace():
+    return _request_trace.get()
+
+def end_trace(token):
+    trace = _request_trace.get()
+    _request_trace.reset(token)
+    return trace
+
+def server_timing(trace):
+    """Format spans as a Server-Timing header value (durations in ms)"""
+    entries = []
+    for stage, seconds in trace:
+        name = ''.join(c if c.isalnum() or c in '._-' else '.' for c in stage)
+        entries.append(f"{name};dur={seconds * 1000:.2f}")
+    return ', '.join(entries)
+
+def render():
+    lines = []
+    for metric in (requests_total, request_duration, stage_duration):
+        lines.extend(metric.render())
+    for collect in _collectors:
+        lines.extend(collect())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,124 @@
+from collections import Counter
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+import weakref
+import logging
+import torch
+from models import metrics
+
+logger = logging.getLogger(__name__)
+
+# Threads do not survive fork, so a forked serving worker restarts the worker
+# of every batcher still alive. One hook serves them all: at-fork hooks cannot
+# be unregistered, and per-instance ones would revive every batcher ever made
+_batchers = weakref.WeakSet()
+
+def _restart_batchers():
+    for batcher in list(_batchers):
+        batcher._start_worker()
+
+os.register_at_fork(after_in_child=_restart_batchers)
+
+def _serve(work_queue):
+    """Worker loop. Queued requests reference their batcher, so the thread
+    holds it only while there is work and an unused batcher can be collected;
+    its finalizer then queues None to stop the thread.
+    """
+    while True:
+        request = work_queue.get()
+        if request is None:
+            return
+        request[2]._run_batch(request)
+        del request
+
+class MicroBatcher:
+    """Groups concurrent single-item inference requests into batched forward passes.
+
+    submit() queues one input tensor and returns a Future. A worker thread
+    waits for the first request, then keeps collecting for up to max_wait_ms
+    or until max_batch_size items are queued, stacks them and calls
+    batch_fn once under torch.inference_mode. batch_fn takes the stacked
+    tensor and returns one result per row. Spans recorded by batch_fn are
+    copied into the trace of every request in the batch.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5, name='batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._start_worker()
+        _batchers.add(self)
+
+    def _start_worker(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._worker = threading.Thread(target=_serve, args=(self._queue,), name=self.name, daemon=True)
+        self._worker.start()
+        weakref.finalize(self, self._queue.put, None)
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, self, metrics.current_trace()))
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def _collect(self, first):
+        """Gather requests after the first until the batch is full or the wait expires"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, first):
+        batch = self._collect(first)
+        items = [item for item, _, _, _ in batch]
+        futures = [future for _, future, _, _ in batch]
+        traces = [trace for _, _, _, trace in batch if trace is not None]
+        token = metrics.start_trace() if traces else None
+        results, error = None, None
+        try:
+            with torch.inference_mode():
+                results = self.batch_fn(torch.stack(items))
+        except Exception as e:
+            error = e
+        if token is not None:
+            # Before the futures resolve, so callers find the spans in place
+            spans = metrics.end_trace(token)
+            for trace in traces:
+                trace.extend(spans)
+        if error is None:
+            for future, result in zip(futures, results):
+                future.set_result(result)
+        else:
+            logger.error(f"Batched inference failed for {len(batch)} items: {str(error)}")
+            for future in futures:
+                future.set_exception(error)
+        with self._lock:
+            self._batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            items = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batches': batches,
+                'items': items,
+                'mean_batch_size': items / batches if batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items()))
+            }
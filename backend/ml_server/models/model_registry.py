@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import shutil
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows, where serve.py cannot fork workers either
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Content-addressed store of model artifacts with an active version and rollback history.
+
+    Artifacts are copied into the registry directory under their SHA-256, so a
+    version never changes once registered. registry.json records the metadata
+    of every version, which one is active and the order they were activated in.
+
+    Several serving processes may share one registry: every change takes an
+    exclusive lock on registry.lock and re-reads the index before writing it,
+    and refresh() picks up changes made by the other processes.
+    """
+
+    INDEX_FILE = 'registry.json'
+    LOCK_FILE = 'registry.lock'
+
+    def __init__(self, registry_dir, prefix='model'):
+        self.registry_dir = registry_dir
+        self.prefix = prefix
+        self.index_path = os.path.join(registry_dir, self.INDEX_FILE)
+        self.lock_path = os.path.join(registry_dir, self.LOCK_FILE)
+        # Reentrant so a change can span several calls, e.g. load then mark_active
+        self._lock = threading.RLock()
+        self._lock_file = None
+        os.makedirs(registry_dir, exist_ok=True)
+        self._signature = None
+        self._index = self._read_index()
+
+    def _index_signature(self):
+        try:
+            stat = os.stat(self.index_path)
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _read_index(self):
+        # Taken before reading, so a write racing the read is seen by the next refresh
+        self._signature = self._index_signature()
+        if self._signature is None:
+            return {'active': None, 'history': [], 'versions': {}}
+        with open(self.index_path, 'r') as f:
+            return json.load(f)
+
+    def _write_index(self):
+        # Write then rename so a crash never leaves a truncated index behind
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        self._signature = self._index_signature()
+
+    def refresh(self):
+        """Re-read the index if another process changed it; returns whether it did"""
+        if self._index_signature() == self._signature:
+            return False
+        with self._lock:
+            self._index = self._read_index()
+        return True
+
+    @contextmanager
+    def locked(self):
+        """Hold the registry against other threads and processes, with the index re-read.
+
+        Every change goes through here, so it applies on top of the latest
+        index rather than this process's copy. Nested uses share the lock.
+        """
+        with self._lock:
+            if self._lock_file is not None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_file = lock_file
+                try:
+                    self._index = self._read_index()
+                    yield
+                finally:
+                    # Closing the file releases the flock
+                    self._lock_file = None
+
+    @staticmethod
+    def file_hash(path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def artifact_path(self, version):
+        return os.path.join(self.registry_dir, f"{self.prefix}-{version}.joblib")
+
+    def register(self, path, metadata=None):
+        """Copy an artifact into the registry and return its version id"""
+        digest = self.file_hash(path)
+        version = digest[:12]
+
+        with self.locked():
+            if version not in self._index['versions']:
+                shutil.copyfile(path, self.artifact_path(version))
+                self._index['versions'][version] = {
+                    'version': version,
+                    'sha256': digest,
+                    'source': os.path.abspath(path),
+                    'size_bytes': os.path.getsize(path),
+                    'registered_at': datetime.now(timezone.utc).isoformat(),
+                    **(metadata or {})
+                }
+                self._write_index()
+                logger.info(f"Registered model version {version} from {path}")
+
+        return version
+
+    def get(self, version):
+        metadata = self._index['versions'].get(version)
+        if metadata is None:
+            raise KeyError(f"Unknown model version: {version}")
+        return metadata
+
+    def __contains__(self, version):
+        return version in self._index['versions']
+
+    @property
+    def active(self):
+        return self._index['active']
+
+    def list_versions(self):
+        return {
+            'active': self._index['active'],
+            'history': list(self._index['history']),
+            'versions': sorted(self._index['versions'].values(), key=lambda v: v['registered_at'])
+        }
+
+    def mark_active(self, version):
+        """Record version as active; call after the model has been swapped in"""
+        with self.locked():
+            self.get(version)
+            if self._index['active'] != version:
+                self._index['active'] = version
+                self._index['history'].append(version)
+                self._write_index()
+
+    def previous(self):
+        """The version that was active before the current one"""
+        history = self._index['history']
+        for version in reversed(history[:-1]):
+            if version != self._index['active']:
+                return version
+        return None
+
+    def mark_rolled_back(self, version):
+        """Drop the current version from the history and make version active"""
+        with self.locked():
+            self.get(version)
+            history = self._index['history']
+            while history and history[-1] != version:
+                history.pop()
+            if not history:
+                history.append(version)
+            self._index['active'] = version
+            self._write_index()
@@ -2,8 +2,6 @@ import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-import requests
 from dotenv import load_dotenv
 import os
 import torch
@@ -11,13 +9,53 @@ import torch.nn as nn
 import easyocr
 import logging
 import re
+import time
+import threading
+import contextvars
+from collections import Counter
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 from torchvision import transforms
+from models.ctc_decoder import CTCDecoder
+from models.image_preprocessing import PreprocessedImage
+from models.micro_batcher import MicroBatcher
+from models.entity_extractor import EntityExtractor, DEFAULT_MEDICATIONS, fold_ocr_text
+from models.lexicon_index import load_lexicon
+from models.label_index import LabelIndex
+from models.drug_knowledge import DrugKnowledgeBase, parse_drug_group
+from models.interaction_index import InteractionIndex
+from models import metrics
 
 load_dotenv()
 
 # Define character list for CRNN model
 char_list = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?()-/: '
 
+TESSERACT_CONFIG = '--psm 6 --oem 3'
+TESSERACT_VARIANTS = ['gray', 'binary_otsu', 'adaptive_gaussian']
+
+OCR_MODES = ('fanout', 'cascade')
+FREQUENCY_SPACING = re.compile(r'(\d)\s*-\s*(\d)\s*-\s*(\d)')
+
+def _run_tesseract(image, config, timeout=0):
+    """Module level so process pool workers can unpickle it"""
+    return pytesseract.image_to_string(image, config=config, timeout=timeout)
+
+def _run_tesseract_scored(image, config, timeout=0):
+    """Tesseract text rebuilt line by line from image_to_data, plus mean word confidence in [0, 1]"""
+    data = pytesseract.image_to_data(image, config=config, timeout=timeout, output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0 or not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(conf / 100)
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
 class Attention(nn.Module):
     def __init__(self, hidden_size):
         super(Attention, self).__init__()
@@ -124,6 +162,12 @@ class PrescriptionAnalyzer:
         try:
             self.easyocr_reader = easyocr.Reader(['en'])
             self.char_list = char_list
+            self.ctc_decoder = CTCDecoder(char_list, beam_size=5, mode=os.getenv('CRNN_DECODER', 'beam'))
+            self.crnn_transform = transforms.Compose([
+                transforms.Resize((32, 128)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.5], std=[0.5])
+            ])
             self.logger.info("Initialized EasyOCR reader")
         except Exception as e:
             self.logger.error(f"Error initializing EasyOCR: {str(e)}")
@@ -131,175 +175,446 @@ class PrescriptionAnalyzer:
         
         # Initialize CRNN model
         try:
-            self.model = CRNN(num_chars=len(char_list))
-            self.logger.info("Initialized CRNN model")
-            
-            # Load trained model if exists
-            model_path = 'models/crnn_model_best.pth'
-            if os.path.exists(model_path):
-                try:
-                    state_dict = torch.load(model_path, map_location='cpu')
-                    self.model.load_state_dict(state_dict)
-                    self.model.eval()
-                    self.logger.info("Successfully loaded CRNN model")
-                except Exception as e:
-                    self.logger.error(f"Error loading CRNN model: {str(e)}")
-            else:
-                self.logger.warning(f"No trained model found at {model_path}")
+            self.model_path = 'models/crnn_model_best.pth'
+            # TorchScript artifact from models/export_crnn.py, preferred when present
+            self.export_path = os.getenv('CRNN_EXPORT_PATH', 'models/crnn_model_quantized.pt')
+            self._crnn_signature = self._crnn_files_signature()
+            self.model = self._load_crnn_model()
         except Exception as e:
             self.logger.error(f"Error initializing CRNN model: {str(e)}")
             raise
 
-    def preprocess_image(self, image_path):
-        """Preprocess image for better OCR results"""
+        # Concurrent CRNN requests share batched forward passes unless CRNN_MAX_BATCH is 1
+        self.crnn_batch_timeout = float(os.getenv('CRNN_BATCH_TIMEOUT', 30))
+        crnn_max_batch = int(os.getenv('CRNN_MAX_BATCH', 16))
+        self.crnn_batcher = None
+        if crnn_max_batch > 1:
+            self.crnn_batcher = MicroBatcher(
+                self._run_crnn_batch,
+                max_batch_size=crnn_max_batch,
+                max_wait_ms=float(os.getenv('CRNN_BATCH_WAIT_MS', 5)),
+                name='crnn-batcher'
+            )
+
+        # OCR jobs fan out over an executor: 'thread' (default), 'process' or 'none'
+        self.ocr_executor_kind = os.getenv('OCR_EXECUTOR', 'thread')
+        self.ocr_max_workers = int(os.getenv('OCR_MAX_WORKERS', 1 + len(TESSERACT_VARIANTS)))
+        # Seconds a job may run once started, and may wait for a free worker before that
+        self.ocr_job_timeout = float(os.getenv('OCR_JOB_TIMEOUT', 60))
+        self.ocr_queue_timeout = float(os.getenv('OCR_QUEUE_TIMEOUT', self.ocr_job_timeout))
+        # Large photos are downscaled to this many pixels on the longer side; 0 disables
+        self.ocr_max_dimension = int(os.getenv('OCR_MAX_DIMENSION', 2000))
+        self._init_ocr_executors()
+
+        self.label_index = LabelIndex(os.getenv('CRNN_LABELS_PATH', 'data/train_labels.txt'))
+
+        # Offline RxNorm store, with RxNav (or a mock of it) as the fallback unless RXNAV_HTTP_FALLBACK=0
+        self.RXNAV_API_BASE = os.getenv('RXNAV_API_BASE', 'https://rxnav.nlm.nih.gov/REST')
+        self.drug_knowledge = DrugKnowledgeBase(
+            os.getenv('RXNORM_DB_PATH', 'data/rxnorm.sqlite3'),
+            base_url=self.RXNAV_API_BASE if os.getenv('RXNAV_HTTP_FALLBACK', '1') != '0' else None,
+            cache_size=int(os.getenv('RXNORM_CACHE_SIZE', 4096)),
+            timeout=float(os.getenv('RXNAV_TIMEOUT', 5)),
+            failure_ttl=float(os.getenv('RXNAV_FAILURE_TTL', 30))
+        )
+        # Pairwise interaction check for whole prescriptions, from a CSV or else the store's
+        # table, which is re-read whenever RxNav results or the loader CLI write to it
+        interactions_path = os.getenv('DRUG_INTERACTIONS_PATH', 'data/drug_interactions.csv')
+        if os.path.exists(interactions_path):
+            self.interaction_index = InteractionIndex(interactions_path)
+        else:
+            self.interaction_index = InteractionIndex.from_store(self.drug_knowledge)
+
+        # Medication names, e.g. the name column of a medicines collection export
+        self.lexicon_path = os.getenv('MEDICATION_LEXICON_PATH', 'data/medications.txt')
+        self.entity_extractor = EntityExtractor(
+            load_lexicon(self.lexicon_path) or DEFAULT_MEDICATIONS,
+            fuzzy_max_distance=int(os.getenv('MEDICATION_FUZZY_MAX_DISTANCE', 2))
+        )
+
+        # Cascade mode tries one engine/variant at a time, cheapest first, and
+        # stops at the first result that is confident and has the entities we need
+        self.ocr_mode = os.getenv('OCR_MODE', 'fanout')
+        if self.ocr_mode not in OCR_MODES:
+            raise ValueError(f"Unknown OCR mode: {self.ocr_mode}")
+        self.cascade_order = os.getenv(
+            'OCR_CASCADE_ORDER',
+            ','.join([f"tesseract:{img_type}" for img_type in TESSERACT_VARIANTS] + ['easyocr'])
+        ).split(',')
+        self.cascade_min_confidence = float(os.getenv('OCR_CASCADE_MIN_CONFIDENCE', 0.6))
+        self.cascade_required = os.getenv('OCR_CASCADE_REQUIRE', 'medications,dosages,frequencies').split(',')
+        self._stage_counts = Counter()
+        self._dropped_jobs = Counter()
+        self._stage_lock = threading.Lock()
+
+    def _load_crnn_model(self):
+        """Load the exported CRNN if it is up to date, else build one from the trained weights"""
+        if self.export_path and os.path.exists(self.export_path):
+            if os.path.exists(self.model_path) and os.path.getmtime(self.model_path) > os.path.getmtime(self.export_path):
+                self.logger.warning(f"{self.export_path} is older than {self.model_path}, using the eager model")
+            else:
+                try:
+                    model = torch.jit.load(self.export_path, map_location='cpu')
+                    model.eval()
+                    self.logger.info(f"Loaded exported CRNN from {self.export_path}")
+                    return model
+                except Exception as e:
+                    self.logger.error(f"Error loading exported CRNN: {str(e)}")
+
+        model = CRNN(num_chars=len(char_list))
+        self.logger.info("Initialized CRNN model")
+        
+        # Load trained model if exists
+        if os.path.exists(self.model_path):
+            try:
+                state_dict = torch.load(self.model_path, map_location='cpu')
+                model.load_state_dict(state_dict)
+                model.eval()
+                self.logger.info("Successfully loaded CRNN model")
+            except Exception as e:
+                self.logger.error(f"Error loading CRNN model: {str(e)}")
+        else:
+            self.logger.warning(f"No trained model found at {self.model_path}")
+        
+        model.eval()
+        return model
+
+    def _init_ocr_executors(self):
+        """Create the pools the OCR jobs run on"""
+        if self.ocr_executor_kind not in ('thread', 'process', 'none'):
+            raise ValueError(f"Unknown OCR executor: {self.ocr_executor_kind}")
+
+        self._easyocr_executor = None
+        self._tesseract_executor = None
+        if self.ocr_executor_kind == 'none':
+            return
+
+        # The EasyOCR reader lives in this process, so it always runs on a thread;
+        # Tesseract jobs can go to worker processes since they only need the image
+        self._easyocr_executor = ThreadPoolExecutor(
+            max_workers=self.ocr_max_workers, thread_name_prefix='ocr'
+        )
+        if self.ocr_executor_kind == 'process':
+            self._tesseract_executor = ProcessPoolExecutor(
+                max_workers=self.ocr_max_workers, mp_context=mp.get_context('spawn')
+            )
+        else:
+            self._tesseract_executor = self._easyocr_executor
+        self.logger.info(f"OCR jobs run on a {self.ocr_executor_kind} pool of {self.ocr_max_workers} workers")
+
+    def _crnn_files_signature(self):
+        signature = []
+        for path in (self.model_path, self.export_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except (OSError, TypeError):
+                signature.append(None)
+        return tuple(signature)
+
+    def reload_crnn_model(self, if_changed=False):
+        """Swap in the latest trained CRNN weights, e.g. after a training job.
+
+        With if_changed, only if the weight files changed since the last load,
+        e.g. when another serving process announces a change.
+        """
+        signature = self._crnn_files_signature()
+        if if_changed and signature == self._crnn_signature:
+            return False
+        self._crnn_signature = signature
+        self.model = self._load_crnn_model()
+        return True
+
+    def load_image(self, source):
+        """Decode an image path, encoded bytes or an already decoded BGR array"""
+        if isinstance(source, np.ndarray):
+            return source
+        with metrics.span('prescription.decode'):
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+            else:
+                image = cv2.imread(source)
+        if image is None:
+            raise ValueError("Could not read image")
+        return image
+
+    def preprocess_image(self, image):
+        """Preprocess image for better OCR results.
+
+        Returns a mapping of variant name to image whose variants are only
+        computed when an OCR stage asks for them.
+        """
         try:
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise Exception("Could not read image")
-
-            # Resize image while maintaining aspect ratio
-            height, width = image.shape[:2]
-            target_height = 2000
-            ratio = target_height / height
-            new_width = int(width * ratio)
-            image = cv2.resize(image, (new_width, target_height))
-
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply different preprocessing techniques
-            preprocessed_images = {
-                'original': image,
-                'gray': gray,
-                'binary_otsu': cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
-                'adaptive_gaussian': cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            }
-            
-            # Apply additional preprocessing to improve text detection
-            for key in ['gray', 'binary_otsu', 'adaptive_gaussian']:
-                # Remove noise
-                preprocessed_images[key] = cv2.fastNlMeansDenoising(preprocessed_images[key])
-                
-                # Increase contrast
-                preprocessed_images[key] = cv2.convertScaleAbs(
-                    preprocessed_images[key],
-                    alpha=1.5,  # Contrast control
-                    beta=0      # Brightness control
-                )
-            
-            return preprocessed_images
+            image = self.load_image(image)
+            return PreprocessedImage(image, max_dimension=self.ocr_max_dimension)
             
         except Exception as e:
             self.logger.error(f"Error in image preprocessing: {str(e)}")
             raise
 
-    def extract_text(self, image_path):
-        """Extract text using both OCR and trained CRNN model"""
+    def extract_text(self, image, mode=None):
+        """Extract text using both OCR and trained CRNN model.
+
+        image may be a file path, encoded image bytes or a decoded BGR array;
+        it is decoded once and shared by every stage.
+        """
+        return self.extract_text_details(image, mode)['text']
+
+    def extract_text_details(self, image, mode=None):
+        """Like extract_text, but also report which OCR stage produced the text"""
+        mode = mode or self.ocr_mode
+        if mode not in OCR_MODES:
+            raise ValueError(f"ocr_mode must be one of {', '.join(OCR_MODES)}")
         try:
-            # Existing OCR methods
-            ocr_text = self._extract_text_ocr(image_path)
+            image = self.load_image(image)
             
-            # CRNN prediction
-            crnn_text = self._extract_text_crnn(image_path)
+            # Existing OCR methods
+            with metrics.span(f"ocr.{mode}"):
+                if mode == 'cascade':
+                    ocr_text, stage = self._extract_text_cascade(image)
+                else:
+                    ocr_text, stage = self._extract_text_ocr(image), 'fanout'
+            
+            # CRNN prediction, only needed when OCR found nothing
+            if not ocr_text.strip():
+                crnn_text = self._extract_text_crnn(image)
+                stage = 'crnn'
+            else:
+                crnn_text = ''
             
             # Combine results
             combined_text = self._combine_predictions(ocr_text, crnn_text)
+            self._record_stage(mode, stage)
             
-            return combined_text
+            return {'text': combined_text, 'mode': mode, 'stage': stage}
             
         except Exception as e:
             self.logger.error(f"Error in text extraction: {str(e)}")
-            return ""
+            return {'text': '', 'mode': mode, 'stage': None}
+
+    def _record_stage(self, mode, stage):
+        with self._stage_lock:
+            self._stage_counts[(mode, stage)] += 1
+
+    def _record_dropped_job(self, name, reason):
+        with self._stage_lock:
+            self._dropped_jobs[(name, reason)] += 1
+
+    def ocr_dropped_job_stats(self):
+        """How often each OCR job was dropped since startup, by reason: queued, timeout or error"""
+        with self._stage_lock:
+            counts = dict(self._dropped_jobs)
+        stats = {}
+        for (name, reason), count in counts.items():
+            stats.setdefault(name, {})[reason] = count
+        return stats
+
+    def ocr_stage_stats(self):
+        """How often each mode/stage produced the final text since startup"""
+        with self._stage_lock:
+            counts = dict(self._stage_counts)
+        stats = {}
+        for (mode, stage), count in counts.items():
+            stats.setdefault(mode, {})[stage] = count
+        return stats
+
+    def _run_easyocr(self, image):
+        # Lower threshold, line by line, text only
+        return self.easyocr_reader.readtext(image, paragraph=False, detail=0)
+
+    def _ocr_jobs(self):
+        """(name, executor, fn, variant, args) for every OCR engine/variant, in merge order"""
+        # Tesseract enforces the timeout itself by killing its subprocess
+        jobs = [('easyocr', self._easyocr_executor, self._run_easyocr, 'original', ())]
+        for img_type in TESSERACT_VARIANTS:
+            jobs.append((
+                f"tesseract:{img_type}", self._tesseract_executor, _run_tesseract,
+                img_type, (TESSERACT_CONFIG, self.ocr_job_timeout)
+            ))
+        return jobs
+
+    def _run_variant_job(self, started, name, executor, fn, images, variant, args):
+        """Resolve the job's image variant on the worker, then run it"""
+        started[name] = time.monotonic()
+        image = images[variant]
+        if executor is not self._easyocr_executor:
+            # Process pool jobs need the pixels pickled, so the variant is built on this thread first
+            return executor.submit(fn, image, *args).result()
+        return fn(image, *args)
+
+    def _run_ocr_jobs(self, jobs, images):
+        """Run OCR jobs concurrently; results come back in job order, None for failures.
+
+        Variants are resolved inside each job, so EasyOCR on the original
+        image does not wait for the denoising the Tesseract variants need.
+        """
+        if self.ocr_executor_kind == 'none':
+            results = []
+            for name, _, fn, variant, args in jobs:
+                try:
+                    with metrics.span(f"ocr.{name}"):
+                        results.append(fn(images[variant], *args))
+                except Exception as e:
+                    self.logger.error(f"OCR error in {name}: {str(e)}")
+                    self._record_dropped_job(name, 'error')
+                    results.append(None)
+            return results
+
+        submitted_at = time.monotonic()
+        started = {}
+        futures = []
+        trace = metrics.current_trace()
+        for name, executor, fn, variant, args in jobs:
+            # Each job runs in its own copy of this context, so the preprocess.*
+            # spans it records land in the request's trace
+            future = self._easyocr_executor.submit(
+                contextvars.copy_context().run,
+                self._run_variant_job, started, name, executor, fn, images, variant, args
+            )
+            # Timed from start to completion, so process pool jobs are covered too
+            future.add_done_callback(
+                lambda _, name=name: metrics.observe(
+                    f"ocr.{name}", time.monotonic() - started.get(name, submitted_at), trace
+                )
+            )
+            futures.append((name, future))
+
+        return [self._wait_for_ocr_job(name, future, started, submitted_at) for name, future in futures]
+
+    def _wait_for_ocr_job(self, name, future, started, submitted_at):
+        """One job's result, or None if it failed or was dropped.
 
-    def _extract_text_ocr(self, image_path):
+        A job may wait ocr_queue_timeout for a worker, then gets
+        ocr_job_timeout from when it started, so time spent queued behind
+        other requests does not count against its run time.
+        """
+        while True:
+            started_at = started.get(name)
+            if started_at is None:
+                deadline = submitted_at + self.ocr_queue_timeout
+            else:
+                deadline = started_at + self.ocr_job_timeout
+            try:
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                if started_at is None and name in started:
+                    # It got a worker while we waited; give it its full run time
+                    continue
+                future.cancel()
+                if started_at is None:
+                    self.logger.error(f"OCR job {name} dropped after waiting {self.ocr_queue_timeout}s for a worker")
+                    self._record_dropped_job(name, 'queued')
+                else:
+                    self.logger.error(f"OCR job {name} timed out after {self.ocr_job_timeout}s")
+                    self._record_dropped_job(name, 'timeout')
+                return None
+            except Exception as e:
+                self.logger.error(f"OCR error in {name}: {str(e)}")
+                self._record_dropped_job(name, 'error')
+                return None
+
+    def _extract_text_ocr(self, image):
         """Extract text using multiple OCR methods"""
         try:
             # Preprocess image
-            images = self.preprocess_image(image_path)
-            
-            # Store all extracted texts
-            extracted_texts = []
+            images = self.preprocess_image(image)
             
-            # Try EasyOCR with lower threshold for better detection
-            try:
-                easyocr_result = self.easyocr_reader.readtext(
-                    images['original'],
-                    paragraph=False,  # Process line by line
-                    detail=0  # Return only text
-                )
-                extracted_texts.extend(easyocr_result)
-            except Exception as e:
-                self.logger.error(f"EasyOCR error: {str(e)}")
-            
-            # Try Tesseract with different preprocessing
-            for img_type in ['gray', 'binary_otsu', 'adaptive_gaussian']:
-                try:
-                    text = pytesseract.image_to_string(
-                        images[img_type],
-                        config='--psm 6 --oem 3'
-                    )
-                    if text.strip():
-                        extracted_texts.append(text)
-                except Exception as e:
-                    self.logger.error(f"Tesseract error with {img_type}: {str(e)}")
-            
-            # Combine and clean results
-            combined_text = '\n'.join(extracted_texts)
-            cleaned_text = self._clean_text(combined_text)
-            
-            return cleaned_text
+            # EasyOCR and the Tesseract variants run concurrently
+            easyocr_result, *tesseract_texts = self._run_ocr_jobs(self._ocr_jobs(), images)
+            return self._merge_ocr_results(easyocr_result, tesseract_texts)
             
         except Exception as e:
             self.logger.error(f"Error in text extraction: {str(e)}")
             return ""
 
-    def _extract_text_crnn(self, image_path):
-        """Extract text using trained CRNN model"""
+    def _merge_ocr_results(self, easyocr_result, tesseract_texts):
+        """Merge in a fixed order: EasyOCR lines, then each Tesseract variant; None marks a failed job"""
+        extracted_texts = list(easyocr_result or [])
+        extracted_texts.extend(text for text in tesseract_texts if text and text.strip())
+        
+        # Combine and clean results
+        combined_text = '\n'.join(extracted_texts)
+        return self._clean_text(combined_text)
+
+    def _cascade_job(self, stage):
+        """The scored OCR job for one cascade stage; returns (text, confidence)"""
+        if stage == 'easyocr':
+            return (stage, self._easyocr_executor, self._run_easyocr_scored, 'original', ())
+        engine, _, img_type = stage.partition(':')
+        if engine != 'tesseract' or img_type not in TESSERACT_VARIANTS:
+            raise ValueError(f"Unknown OCR cascade stage: {stage}")
+        return (stage, self._tesseract_executor, _run_tesseract_scored,
+                img_type, (TESSERACT_CONFIG, self.ocr_job_timeout))
+
+    def _run_easyocr_scored(self, image):
+        results = self.easyocr_reader.readtext(image, paragraph=False, detail=1)
+        text = '\n'.join(result[1] for result in results)
+        confidence = sum(result[2] for result in results) / len(results) if results else 0.0
+        return text, float(confidence)
+
+    def _cascade_accepts(self, text, confidence):
+        """Whether a stage's output is good enough to stop the cascade"""
+        if not text.strip() or confidence < self.cascade_min_confidence:
+            return False
+        entities = self.analyze_prescription(text)
+        return all(entities.get(kind) for kind in self.cascade_required)
+
+    def _extract_text_cascade(self, image):
+        """Run OCR stages cheapest first until one passes the confidence and entity gate"""
         try:
-            # Load and preprocess image
-            image = Image.open(image_path).convert('L')
-            transform = transforms.Compose([
-                transforms.Resize((32, 128)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.5], std=[0.5])
-            ])
+            images = self.preprocess_image(image)
             
-            image = transform(image).unsqueeze(0)
+            outputs = {}
+            for stage in self.cascade_order:
+                result = self._run_ocr_jobs([self._cascade_job(stage)], images)[0]
+                if result is None:
+                    continue
+                text, confidence = result
+                text = self._clean_text(text)
+                outputs[stage] = text
+                self.logger.debug(f"OCR cascade stage {stage}: confidence {confidence:.2f}")
+                if self._cascade_accepts(text, confidence):
+                    return text, stage
+            
+            # Nothing passed the gate: merge every stage like the fan-out path does
+            merge_order = ['easyocr'] + [f"tesseract:{img_type}" for img_type in TESSERACT_VARIANTS]
+            merged = [outputs[stage] for stage in merge_order if outputs.get(stage, '').strip()]
+            return '\n'.join(merged), 'merged'
             
-            # Get prediction
-            self.model.eval()
-            with torch.no_grad():
-                output = self.model(image)
-                output = output.log_softmax(2)
-                
-                # Beam search decoding
-                beam_size = 5
-                sequences = [([], 0.0)]
-                
-                for t in range(output.size(1)):
-                    candidates = []
-                    for seq, score in sequences:
-                        probs = output[0, t].exp()
-                        top_probs, top_indices = probs.topk(beam_size)
-                        
-                        for prob, idx in zip(top_probs, top_indices):
-                            if idx < len(self.char_list):
-                                new_seq = seq + [self.char_list[idx]]
-                                new_score = score - torch.log(prob)
-                                candidates.append((new_seq, new_score))
-                
-                    # Select top sequences
-                    sequences = sorted(candidates, key=lambda x: x[1])[:beam_size]
-                
-                # Select best sequence
-                best_seq = sequences[0][0]
-                pred_text = ''.join(best_seq)
-                
-                # Clean up prediction
-                pred_text = self._clean_prediction(pred_text)
-                
-                return pred_text
+        except Exception as e:
+            self.logger.error(f"Error in cascade text extraction: {str(e)}")
+            return "", None
+
+    def _run_crnn_batch(self, images):
+        """Decode a [batch, 1, 32, 128] tensor of line images to one string each"""
+        with metrics.span('crnn.forward'):
+            output = self.model(images).log_softmax(2)
+        with metrics.span('crnn.ctc_decode'):
+            return self.ctc_decoder.decode(output)
+
+    def crnn_batching_stats(self):
+        return self.crnn_batcher.stats() if self.crnn_batcher is not None else None
+
+    def _extract_text_crnn(self, image):
+        """Extract text using trained CRNN model"""
+        try:
+            # Load and preprocess image
+            image = self.load_image(image)
+            image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+            image = self.crnn_transform(image)
+            
+            # Get prediction, batched with other concurrent requests when enabled
+            with metrics.span('crnn'):
+                if self.crnn_batcher is not None:
+                    pred_text = self.crnn_batcher.submit(image).result(timeout=self.crnn_batch_timeout)
+                else:
+                    with torch.inference_mode():
+                        pred_text = self._run_crnn_batch(image.unsqueeze(0))[0]
+            
+            # Clean up prediction
+            pred_text = self._clean_prediction(pred_text)
+            
+            return pred_text
                 
         except Exception as e:
             self.logger.error(f"CRNN extraction error: {str(e)}")
@@ -388,26 +703,12 @@ class PrescriptionAnalyzer:
         
         return correct_parts / total_parts if total_parts > 0 else 0
 
-    def _find_closest_match(self, predicted_text):
+    def _find_closest_match(self, predicted_text, min_score=0.7):
         """Find closest matching training label"""
         try:
-            with open('data/train_labels.txt', 'r') as f:
-                training_samples = [line.strip().split(',')[1] for line in f]
-            
-            # Simple string similarity
-            def similarity(a, b):
-                a = a.lower()
-                b = b.lower()
-                return sum(1 for x, y in zip(a, b) if x == y) / max(len(a), len(b))
-            
-            matches = [(sample, similarity(predicted_text, sample)) 
-                      for sample in training_samples]
-            best_match = max(matches, key=lambda x: x[1])
-            
-            if best_match[1] > 0.7:  # If similarity is high enough
-                return best_match[0]
-            return None
-            
+            matches = self.label_index.top_k(predicted_text, k=1, min_score=min_score)
+            return matches[0][0] if matches else None
+
         except Exception as e:
             self.logger.error(f"Error finding closest match: {str(e)}")
             return None
@@ -466,177 +767,106 @@ class PrescriptionAnalyzer:
 
     def analyze_prescription(self, text):
         """Analyze the extracted text to identify prescription elements"""
-        try:
-            self.logger.info(f"Analyzing text: {text}")
-            
-            entities = {
-                'medications': [],
-                'dosages': [],
-                'frequencies': []
-            }
-
-            # Common medication patterns
-            med_patterns = [
-                r'paracetamol',
-                r'dolo',
-                r'crocin',
-                # Add more patterns
-            ]
-
-            # Dosage patterns
-            dosage_patterns = [
-                r'\d+\s*mg',
-                r'\d+\s*ml',
-                r'\d+\s*g'
-            ]
-
-            # Frequency patterns
-            freq_patterns = [
-                r'[0-1]-[0-1]-[0-1]',
-                r'[0-1]\s*-\s*[0-1]\s*-\s*[0-1]'
-            ]
-
-            # Process each line
-            lines = text.lower().split('\n')
-            for line in lines:
-                self.logger.debug(f"Processing line: {line}")
-                
-                # Clean the line
-                line = self._clean_text(line)
-                
-                # Check for medications
-                for pattern in med_patterns:
-                    if re.search(pattern, line, re.IGNORECASE):
-                        med = re.search(pattern, line, re.IGNORECASE).group()
-                        if med not in entities['medications']:
-                            entities['medications'].append(med)
-                            self.logger.debug(f"Found medication: {med}")
-
-                # Check for dosages
-                for pattern in dosage_patterns:
-                    matches = re.findall(pattern, line, re.IGNORECASE)
-                    for match in matches:
-                        if match not in entities['dosages']:
-                            entities['dosages'].append(match)
-                            self.logger.debug(f"Found dosage: {match}")
-
-                # Check for frequencies
-                for pattern in freq_patterns:
-                    matches = re.findall(pattern, line)
-                    for match in matches:
-                        if match not in entities['frequencies']:
-                            entities['frequencies'].append(match)
-                            self.logger.debug(f"Found frequency: {match}")
-
-            self.logger.info(f"Analysis results: {entities}")
-            return entities
+        with metrics.span('prescription.analyze'):
+            try:
+                self.logger.info(f"Analyzing text: {text}")
+                entities = self.entity_extractor.extract(text)
+                self.logger.info(f"Analysis results: {entities}")
+                return entities
 
-        except Exception as e:
-            self.logger.error(f"Error in prescription analysis: {str(e)}")
-            return {
-                'medications': [],
-                'dosages': [],
-                'frequencies': []
-            }
+            except Exception as e:
+                self.logger.error(f"Error in prescription analysis: {str(e)}")
+                return {
+                    'medications': [],
+                    'dosages': [],
+                    'frequencies': []
+                }
 
     def _clean_text(self, text):
         """Clean and standardize text"""
         # Convert common OCR mistakes
-        replacements = {
-            'l': '1',
-            'i': '1',
-            'o': '0',
-            'O': '0',
-            '|': '1',
-            'I': '1',
-            'mg.': 'mg',
-            'mgs': 'mg',
-            'ML': 'ml',
-            'ML.': 'ml',
-            'Ml': 'ml',
-            'G': 'g',
-            'G.': 'g'
-        }
-        
-        for old, new in replacements.items():
-            text = text.replace(old, new)
+        text = fold_ocr_text(text)
         
         # Standardize spacing around hyphens in frequencies
-        text = re.sub(r'(\d)\s*-\s*(\d)\s*-\s*(\d)', r'\1-\2-\3', text)
-        
-        return text
+        return FREQUENCY_SPACING.sub(r'\1-\2-\3', text)
 
     def get_medicine_details(self, medicine_name):
+        details = self.get_medicines_details([medicine_name])
+        return details.get(medicine_name.strip())
+
+    def get_medicines_details(self, medicine_names):
+        """Details for many medicines with one store lookup; unknown names are left out"""
         try:
-            # Clean medicine name
-            medicine_name = medicine_name.strip()
-            if not medicine_name or medicine_name in ['[CLS]', '[SEP]', '[PAD]']:
-                return None
+            names = [name.strip() for name in medicine_names]
+            names = [name for name in names if name and name not in ['[CLS]', '[SEP]', '[PAD]']]
+            found = self.drug_knowledge.find_drugs(names)
+            return {name: {"name": name, "details": details} for name, details in found.items() if details}
 
-            # Get RxNorm details
-            rxnav_response = requests.get(
-                f"{self.RXNAV_API_BASE}/drugs",
-                params={"name": medicine_name}
-            )
-            
-            if rxnav_response.status_code == 200:
-                rxnav_data = rxnav_response.json()
-                if 'drugGroup' in rxnav_data and 'conceptGroup' in rxnav_data['drugGroup']:
-                    return {
-                        "name": medicine_name,
-                        "details": self.get_drug_details(rxnav_data)
-                    }
-            
-            return None
-            
         except Exception as e:
-            print(f"Error getting medicine details: {str(e)}")
-            return None
+            self.logger.error(f"Error getting medicine details: {str(e)}")
+            return {}
 
     def get_drug_details(self, rxnav_data):
         try:
-            concept_group = rxnav_data['drugGroup']['conceptGroup'][0]
-            concept_properties = concept_group.get('conceptProperties', [{}])[0]
-            
-            return {
-                "rxcui": concept_properties.get('rxcui', ''),
-                "name": concept_properties.get('name', ''),
-                "synonym": concept_properties.get('synonym', ''),
-                "tty": concept_properties.get('tty', '')
-            }
-            
+            return parse_drug_group(rxnav_data)
+
         except Exception as e:
-            print(f"Error getting drug details: {str(e)}")
+            self.logger.error(f"Error getting drug details: {str(e)}")
             return {}
 
     def get_drug_interactions(self, rxcui):
         """
-        Get drug interactions from RxNav API
+        Get drug interactions from the offline store, falling back to RxNav
         """
         try:
-            interaction_response = requests.get(
-                f"{self.RXNAV_API_BASE}/interaction/interaction.json",
-                params={"rxcui": rxcui}
-            )
-            
-            if interaction_response.status_code == 200:
-                data = interaction_response.json()
-                if 'interactionTypeGroup' in data:
-                    interactions = []
-                    for group in data['interactionTypeGroup']:
-                        for interaction in group['interactionType']:
-                            interactions.append({
-                                'drug': interaction['interactionPair'][0]['interactionConcept'][1]['minConceptItem']['name'],
-                                'severity': interaction['severity'],
-                                'description': interaction['description']
-                            })
-                    return interactions
-            return []
-            
+            return self.drug_knowledge.interactions_for([rxcui])[rxcui]
+
         except Exception as e:
-            print(f"Error fetching drug interactions: {str(e)}")
+            self.logger.error(f"Error fetching drug interactions: {str(e)}")
             return []
 
+    def check_interactions(self, medications):
+        """Every interacting pair among a prescription's medications, most severe first.
+
+        Names resolve to rxcuis with one store lookup (no RxNav requests on
+        this path) and all pairs are checked against the interaction index.
+        An empty index adds a warning, since "no pairs" then means unchecked.
+        """
+        try:
+            with metrics.span('prescription.interactions'):
+                indexed_pairs = len(self.interaction_index)
+                resolved = self.drug_knowledge.find_drugs(medications, fetch=False)
+                rxcuis = {}
+                for name, details in resolved.items():
+                    if details:
+                        rxcuis.setdefault(details['rxcui'], name)
+                pairs = [
+                    {
+                        'drugs': [rxcuis[a], rxcuis[b]],
+                        'rxcuis': [a, b],
+                        'severity': severity,
+                        'description': description
+                    }
+                    for a, b, severity, description in self.interaction_index.pairs(rxcuis)
+                ]
+                result = {
+                    'pairs': pairs,
+                    'unresolved': [name for name, details in resolved.items() if not details],
+                    'indexed_pairs': indexed_pairs
+                }
+                if not indexed_pairs:
+                    result['warning'] = 'No drug interaction data is loaded; interactions were not checked'
+                return result
+
+        except Exception as e:
+            self.logger.error(f"Error checking drug interactions: {str(e)}")
+            return {
+                'pairs': [],
+                'unresolved': list(medications),
+                'indexed_pairs': 0,
+                'warning': 'Drug interactions could not be checked'
+            }
+
     def segment_prescription(self, image):
         # Implement line segmentation
         horizontal = np.copy(image)
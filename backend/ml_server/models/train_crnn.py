@@ -5,7 +5,13 @@ from torch.utils.data import Dataset, DataLoader
 import cv2
 import numpy as np
 import os
-from prescription_analyzer import CRNN, char_list
+if __package__:
+    from models.prescription_analyzer import CRNN, char_list
+    from models.ctc_decoder import CTCDecoder
+else:
+    # Run as a script with models/ on the path
+    from prescription_analyzer import CRNN, char_list
+    from ctc_decoder import CTCDecoder
 from torchvision import transforms
 from PIL import Image
 import albumentations as A
@@ -145,51 +151,50 @@ def validate_epoch(model, val_loader, criterion, device):
     
     return total_loss / len(val_loader)
 
-def test_on_training_samples(model, dataset, char_list, device):
+def test_on_training_samples(model, dataset, char_list, device, batch_size=32):
     """Test the model on training samples"""
     model.eval()
+    decoder = CTCDecoder(char_list, beam_size=5)
     correct = 0
     total = 0
     
     print(f"\nTesting on {len(dataset)} samples...")
     
+    def predict(images):
+        output = model(torch.stack(images).to(device))
+        output = output.log_softmax(2)
+        return decoder.decode(output)
+
     with torch.no_grad():
-        for idx in range(len(dataset)):
+        for start in range(0, len(dataset), batch_size):
+            # Get samples; an unreadable one is skipped on its own, not with its batch
+            indices, images = [], []
+            for idx in range(start, min(start + batch_size, len(dataset))):
+                try:
+                    images.append(dataset[idx][0])
+                    indices.append(idx)
+                except Exception as e:
+                    print(f"Error processing sample {idx}: {str(e)}")
+            if not images:
+                continue
+
+            # Get model predictions and decode the whole batch at once, or one
+            # sample at a time if the batch fails, to find the bad sample
             try:
-                # Get sample
-                image, target, _ = dataset[idx]
-                image = image.unsqueeze(0).to(device)
-                
+                predictions = predict(images)
+            except Exception:
+                predictions = []
+                for idx, image in zip(list(indices), images):
+                    try:
+                        predictions.extend(predict([image]))
+                    except Exception as e:
+                        print(f"Error processing sample {idx}: {str(e)}")
+                        indices.remove(idx)
+            
+            for idx, pred_text in zip(indices, predictions):
                 # Get original text
                 original_text = dataset.samples[idx][1]
                 
-                # Get model prediction
-                output = model(image)
-                output = output.log_softmax(2)
-                
-                # Beam search decoding
-                beam_size = 5
-                sequences = [([], 0.0)]
-                
-                for t in range(output.size(1)):
-                    candidates = []
-                    for seq, score in sequences:
-                        probs = output[0, t].exp()
-                        top_probs, top_indices = probs.topk(beam_size)
-                        
-                        for prob, idx in zip(top_probs, top_indices):
-                            if idx < len(char_list):
-                                new_seq = seq + [char_list[idx]]
-                                new_score = score - torch.log(prob)
-                                candidates.append((new_seq, new_score))
-                    
-                    # Select top sequences
-                    sequences = sorted(candidates, key=lambda x: x[1])[:beam_size]
-                
-                # Select best sequence
-                best_seq = sequences[0][0] if sequences else []
-                pred_text = ''.join(best_seq)
-                
                 # Clean up prediction
                 pred_text = clean_prediction(pred_text)
                 
@@ -201,10 +206,6 @@ def test_on_training_samples(model, dataset, char_list, device):
                 if pred_text.strip().lower() == original_text.strip().lower():
                     correct += 1
                 total += 1
-                
-            except Exception as e:
-                print(f"Error processing sample {idx}: {str(e)}")
-                continue
     
     if total > 0:
         print(f"\nAccuracy: {(correct/total)*100:.2f}%")
@@ -237,7 +238,13 @@ def clean_prediction(text):
     
     return text
 
-def train_crnn():
+def train_crnn(progress_callback=None, should_stop=None):
+    """Train the CRNN and save the best weights to models/crnn_model_best.pth.
+
+    progress_callback(epoch=..., num_epochs=..., loss=..., best_loss=...) is
+    called after every epoch, and training stops early once should_stop()
+    returns True. Returns a summary of the run.
+    """
     # Create necessary directories
     os.makedirs('data/train_images', exist_ok=True)
     os.makedirs('models', exist_ok=True)
@@ -309,7 +316,13 @@ def train_crnn():
     )
     
     print("\nStarting training...")
+    epochs_run = 0
+    cancelled = False
     for epoch in range(num_epochs):
+        if should_stop is not None and should_stop():
+            print("Training cancelled.")
+            cancelled = True
+            break
         try:
             train_loss = train_epoch(model, train_loader, criterion, optimizer, device)
             
@@ -320,12 +333,24 @@ def train_crnn():
             
             if train_loss < best_loss:
                 best_loss = train_loss
-                torch.save(model.state_dict(), 'models/crnn_model_best.pth')
+                # Write then rename so the server never loads a half-written checkpoint
+                tmp_path = 'models/crnn_model_best.pth.tmp'
+                torch.save(model.state_dict(), tmp_path)
+                os.replace(tmp_path, 'models/crnn_model_best.pth')
                 print(f'Model saved (Loss: {best_loss:.4f})')
                 no_improve = 0
             else:
                 no_improve += 1
             
+            epochs_run = epoch + 1
+            if progress_callback is not None:
+                progress_callback(
+                    epoch=epochs_run,
+                    num_epochs=num_epochs,
+                    loss=train_loss,
+                    best_loss=best_loss
+                )
+            
             if train_loss < min_loss:
                 print("Reached target loss. Stopping training.")
                 break
@@ -339,10 +364,17 @@ def train_crnn():
     
     print("\nTraining completed!")
     
-    # Test the trained model
-    print("\nTesting trained model...")
-    model.eval()
-    test_on_training_samples(model, train_dataset, char_list, device)
+    if not cancelled:
+        # Test the trained model
+        print("\nTesting trained model...")
+        model.eval()
+        test_on_training_samples(model, train_dataset, char_list, device)
+    
+    return {
+        'epochs': epochs_run,
+        'best_loss': best_loss,
+        'cancelled': cancelled
+    }
 
 if __name__ == '__main__':
     train_crnn() 
\ No newline at end of file
@@ -0,0 +1,280 @@
+from datetime import datetime, timezone
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import uuid
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows, where serve.py cannot fork workers either
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+def _run_training_job(progress_queue, cancel_event):
+    """Entry point of the training process; reports back through progress_queue"""
+    try:
+        from models.train_crnn import train_crnn
+
+        def report_progress(**progress):
+            progress_queue.put(('progress', progress))
+
+        summary = train_crnn(progress_callback=report_progress, should_stop=cancel_event.is_set)
+        status = 'cancelled' if summary['cancelled'] else 'completed'
+        progress_queue.put((status, summary))
+    except Exception as e:
+        progress_queue.put(('failed', {'error': str(e)}))
+
+class TrainingJobManager:
+    """Runs CRNN training in a separate process and tracks its progress.
+
+    Only one job runs at a time since every run writes the same checkpoint.
+    on_complete is called in the server process after a job finishes
+    successfully, e.g. to reload the trained weights.
+
+    With a state_dir, serving processes that share it (see serve.py) see one
+    set of jobs: each job is written to <id>.json by the process running it,
+    an exclusive lock on train.lock keeps a second process from starting
+    another, and a cancel from another process leaves an <id>.cancel file
+    that the running process picks up within a second.
+    """
+
+    FINISHED = ('completed', 'failed', 'cancelled')
+    LOCK_FILE = 'train.lock'
+
+    def __init__(self, on_complete=None, cancel_timeout=30, state_dir=None):
+        self.on_complete = on_complete
+        self.cancel_timeout = cancel_timeout
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        # Spawn instead of fork: the server process holds torch/OCR threads
+        self._context = mp.get_context('spawn')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def _state_path(self, job_id, suffix='json'):
+        return os.path.join(self.state_dir, f"{job_id}.{suffix}")
+
+    @staticmethod
+    def _public(job):
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    def _save(self, job):
+        """Publish a job's state to the other processes; call with self._lock held"""
+        if not self.state_dir:
+            return
+        path = self._state_path(job['id'])
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self._public(job), f)
+        os.replace(f"{path}.tmp", path)
+
+    def _read(self, job_id):
+        """A job started by another process, or None"""
+        # Ids are uuid hex, which also keeps them from naming other paths
+        if not self.state_dir or not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id), 'r') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] not in self.FINISHED and not self._worker_alive(job['worker_pid']):
+            job['status'] = 'failed'
+            job['error'] = 'The serving process running the job exited'
+        return job
+
+    @staticmethod
+    def _worker_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _shared_ids(self):
+        if not self.state_dir:
+            return []
+        return [name[:-len('.json')] for name in os.listdir(self.state_dir) if name.endswith('.json')]
+
+    def _acquire_training_lock(self):
+        """(lock file, acquired); the file is None when jobs are not shared across processes"""
+        if not self.state_dir or fcntl is None:
+            return None, True
+        lock_file = open(os.path.join(self.state_dir, self.LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None, False
+        return lock_file, True
+
+    def active_job(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] not in self.FINISHED:
+                    return job['id']
+        for job_id in self._shared_ids():
+            job = self._read(job_id)
+            if job is not None and job['status'] not in self.FINISHED:
+                return job_id
+        return None
+
+    def submit(self):
+        """Start a training job and return its id, or None if one is already running"""
+        with self._lock:
+            if any(job['status'] not in self.FINISHED for job in self._jobs.values()):
+                return None
+            # Held until the job finishes; the OS drops it if this process dies
+            lock_file, acquired = self._acquire_training_lock()
+            if not acquired:
+                return None
+
+            job_id = uuid.uuid4().hex
+            progress_queue = self._context.Queue()
+            cancel_event = self._context.Event()
+            process = self._context.Process(
+                target=_run_training_job,
+                args=(progress_queue, cancel_event),
+                daemon=True
+            )
+            job = self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'running',
+                'submitted_at': self._now(),
+                'finished_at': None,
+                'progress': {},
+                'result': None,
+                'error': None,
+                'worker_pid': os.getpid(),
+                '_process': process,
+                '_queue': progress_queue,
+                '_cancel': cancel_event,
+                '_lock_file': lock_file
+            }
+            try:
+                process.start()
+            except Exception:
+                del self._jobs[job_id]
+                if lock_file is not None:
+                    lock_file.close()
+                raise
+            self._save(job)
+
+        threading.Thread(target=self._monitor, args=(job_id,), daemon=True).start()
+        logger.info(f"Started training job {job_id}")
+        return job_id
+
+    def _monitor(self, job_id):
+        """Drain progress messages until the job finishes"""
+        job = self._jobs[job_id]
+        process = job['_process']
+        status, payload = None, None
+
+        while status is None:
+            if self.state_dir and os.path.exists(self._state_path(job_id, 'cancel')):
+                os.remove(self._state_path(job_id, 'cancel'))
+                self.cancel(job_id)
+            # Checked before reading, so whatever the process sent before it
+            # exited is drained before the job is marked failed
+            exited = not process.is_alive()
+            try:
+                kind, payload = job['_queue'].get(block=not exited, timeout=1)
+            except queue.Empty:
+                if exited:
+                    status = 'cancelled' if job['_cancel'].is_set() else 'failed'
+                    payload = {'error': f"Training process exited with code {process.exitcode}"}
+                continue
+            if kind == 'progress':
+                with self._lock:
+                    job['progress'] = payload
+                    self._save(job)
+            else:
+                status = kind
+
+        process.join()
+        with self._lock:
+            job['status'] = status
+            job['finished_at'] = self._now()
+            if status == 'failed':
+                job['error'] = payload.get('error')
+            else:
+                job['result'] = payload
+            self._save(job)
+            if self.state_dir and os.path.exists(self._state_path(job_id, 'cancel')):
+                os.remove(self._state_path(job_id, 'cancel'))
+            if job['_lock_file'] is not None:
+                job['_lock_file'].close()
+        logger.info(f"Training job {job_id} {status}")
+
+        if status == 'completed' and self.on_complete is not None:
+            try:
+                self.on_complete()
+            except Exception as e:
+                logger.error(f"Error after training job {job_id}: {str(e)}")
+
+    def cancel(self, job_id):
+        """Ask a job to stop after the current epoch; kill it if it does not"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self._cancel_shared(job_id)
+        with self._lock:
+            if job['status'] in self.FINISHED:
+                return False
+            # A repeated cancel must not start a second enforcer
+            if job['status'] == 'cancelling':
+                return True
+            job['_cancel'].set()
+            job['status'] = 'cancelling'
+            self._save(job)
+
+        def enforce():
+            job['_process'].join(self.cancel_timeout)
+            if job['_process'].is_alive():
+                logger.warning(f"Training job {job_id} ignored cancellation, terminating")
+                job['_process'].terminate()
+
+        threading.Thread(target=enforce, daemon=True).start()
+        return True
+
+    def _cancel_shared(self, job_id):
+        """Leave a cancel request for the process running the job"""
+        job = self._read(job_id)
+        if job is None:
+            raise KeyError(f"Unknown training job: {job_id}")
+        if job['status'] in self.FINISHED:
+            return False
+        if job['status'] != 'cancelling':
+            open(self._state_path(job_id, 'cancel'), 'w').close()
+        return True
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._read(job_id)
+            if job is None:
+                raise KeyError(f"Unknown training job: {job_id}")
+            return job
+        with self._lock:
+            return self._public(job)
+
+    def list_jobs(self):
+        job_ids = list(self._jobs)
+        job_ids.extend(job_id for job_id in self._shared_ids() if job_id not in self._jobs)
+        jobs = []
+        for job_id in job_ids:
+            try:
+                jobs.append(self.get(job_id))
+            except KeyError:
+                # Being written for the first time, or removed
+                pass
+        return sorted(jobs, key=lambda job: job['submitted_at'])
@@ -0,0 +1,122 @@
+"""Production entry point: load the models once, then fork workers that share them.
+
+    ML_WORKERS=4 PORT=5002 python serve.py
+
+The master process binds the port and loads every component before forking,
+so the EasyOCR weights, the CRNN and the forest sit in pages the workers
+share copy-on-write; the compiled forest arrays are memory-mapped from the
+registry (DISEASE_MODEL_MMAP). Each worker serves the Flask app with
+ML_WORKER_THREADS threads on the shared socket, and the master replaces any
+worker that exits.
+
+A worker that swaps a model (an admin load or rollback, or a finished
+training job) sends SIGHUP to the master, which reloads its own copy, so
+replacement workers fork with the current models, and forwards SIGHUP to
+every worker to do the same. The disease model registry and the training
+job state are files shared by all workers, locked while they are changed.
+"""
+import gc
+import os
+import signal
+import socket
+import threading
+import time
+import logging
+
+# The master loads the components itself, before forking
+os.environ.setdefault('ML_WARMUP_ON_START', '0')
+
+from werkzeug.serving import make_server
+import app as ml_app
+
+logger = logging.getLogger(__name__)
+
+def preload():
+    for name, component in ml_app.COMPONENTS.items():
+        start = time.perf_counter()
+        component.get()
+        logger.info(f"Preloaded {name} in {time.perf_counter() - start:.2f}s")
+    # Objects that exist now live for the whole process; keeping them out of
+    # garbage collection stops the collector from dirtying their shared pages
+    gc.freeze()
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def reload_models():
+    try:
+        ml_app.reload_models()
+    except Exception as e:
+        logger.error(f"Error reloading models: {str(e)}", exc_info=True)
+
+def run_worker(sock, host, port):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Reload off the serving thread; tell the master when this worker swaps a model
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=reload_models, daemon=True).start())
+    ml_app.register_model_change_hook(lambda: os.kill(os.getppid(), signal.SIGHUP))
+    server = make_server(host, port, ml_app.app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+def spawn_worker(sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, host, port)
+        finally:
+            os._exit(0)
+    return pid
+
+def main():
+    host = os.getenv('HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', 5002))
+    num_workers = int(os.getenv('ML_WORKERS', os.cpu_count() or 2))
+
+    sock = bind(host, port)
+    preload()
+
+    workers = {spawn_worker(sock, host, port) for _ in range(num_workers)}
+    logger.info(f"Serving on {host}:{port} with {num_workers} workers: {sorted(workers)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+        reload_models()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, starting a replacement")
+            workers.add(spawn_worker(sock, host, port))
+
+    sock.close()
+
+if __name__ == '__main__':
+    main()